@@ -2,16 +2,12 @@ import base64
 import datetime
 import locale
 import mimetypes
+import multiprocessing
 import os
 import re
 import sys
+import time
 
-import chardet
-import mammoth
-import psutil
-import torch
-from langdetect import DetectorFactory, detect
-from llama_cpp import Llama
 from PySide6.QtCore import *
 from PySide6.QtGui import *
 from PySide6.QtOpenGL import *
@@ -19,8 +15,17 @@ from PySide6.QtOpenGLWidgets import *
 from PySide6.QtPrintSupport import *
 from PySide6.QtWidgets import *
 
+from modules.autosave import *
+from modules.cache import *
+from modules.document import *
 from modules.globals import *
+from modules.hardware import *
+from modules.language import *
+from modules.lazy import *
+from modules.llm import *
+from modules.statistics import *
 from modules.threading import *
+from modules.timing import *
 
 try:
     from ctypes import windll
@@ -31,6 +36,9 @@ try:
 except ImportError:
     pass
 
+psutil = LazyModule("psutil")
+llama_cpp = LazyModule("llama_cpp")
+
 try:
     settings = QSettings("berkaygediz", "SolidWriting")
     lang = settings.value("appLanguage")
@@ -38,28 +46,6 @@ except:
     pass
 
 
-class LLMThread(QThread):
-    result = Signal(str)
-
-    def __init__(self, prompt, llm, parent=None):
-        super(LLMThread, self).__init__(parent)
-        self.prompt = prompt
-        self.llm = llm
-
-    def run(self):
-        response = self.getResponseLLM()
-        self.result.emit(response)
-
-    def getResponseLLM(self):
-        try:
-            response = self.llm.create_chat_completion(
-                messages=[{"role": "user", "content": self.prompt}]
-            )
-            return response["choices"][0]["message"]["content"]
-        except Exception as e:
-            return f"Error: {str(e)}"
-
-
 class SW_ControlInfo(QMainWindow):
     def __init__(self, parent=None):
         super(SW_ControlInfo, self).__init__(parent)
@@ -93,12 +79,20 @@ class SW_ControlInfo(QMainWindow):
         self.layout_central.addWidget(self.title)
         self.setCentralWidget(self.widget_central)
 
-        QTimer.singleShot(500, self.showWS)
+        self.startup_timer = StageTimer()
+        self.first_frame = False
+
+    def paintEvent(self, event):
+        super(SW_ControlInfo, self).paintEvent(event)
+        # The workspace is built once the splash is on screen
+        if not self.first_frame:
+            self.first_frame = True
+            QTimer.singleShot(0, self.showWS)
 
     def showWS(self):
-        self.hide()
-        self.ws_window = SW_Workspace()
-        self.ws_window.show()
+        self.startup_timer.mark("splash")
+        self.ws_window = SW_Workspace(self.startup_timer)
+        self.ws_window.ready.connect(self.hide)
 
 
 class SW_About(QMainWindow):
@@ -124,7 +118,7 @@ class SW_About(QMainWindow):
             f"<b>{app.applicationDisplayName()}</b><br><br>"
             "A supercharged word processor with AI integration, supporting real-time computing and advanced formatting.<br><br>"
             "Made by Berkay Gediz<br><br>"
-            "GNU General Public License v3.0<br>GNU LESSER GENERAL PUBLIC LICENSE v3.0<br>Mozilla Public License Version 2.0<br><br><b>Libraries: </b>mwilliamson/python-mammoth, Mimino666/langdetect, abetlen/llama-cpp-python, <br>pytorch/pytorch, PySide6, chardet, psutil<br><br>"
+            "GNU General Public License v3.0<br>GNU LESSER GENERAL PUBLIC LICENSE v3.0<br>Mozilla Public License Version 2.0<br><br><b>Libraries: </b>mwilliamson/python-mammoth, Mimino666/langdetect, abetlen/llama-cpp-python, <br>PySide6, chardet, psutil<br><br>"
             "OpenGL: <b>ON</b></center>"
         )
         self.setCentralWidget(self.about_label)
@@ -205,13 +199,196 @@ class SW_Help(QMainWindow):
         self.setCentralWidget(scroll_area)
 
 
-class SW_Workspace(QMainWindow):
+class SW_Statistics(QWidget):
+    analysis_keys = [
+        "analysis_message_1",
+        "analysis_message_2",
+        "analysis_message_3",
+        "analysis_message_4",
+        "analysis_message_5",
+    ]
+    statistic_keys = [
+        "statistic_message_1",
+        "statistic_message_2",
+        "statistic_message_3",
+    ]
+
     def __init__(self, parent=None):
+        super(SW_Statistics, self).__init__(parent)
+        self.setStyleSheet(
+            "QLabel {padding: 10px; color: white;}"
+            "QLabel[header='true'] {background-color: #0379FF;}"
+            "#rs-text {background-color: #E2E3E1; color: #000000; font-weight: bold;}"
+        )
+        layout = QHBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.setSpacing(0)
+
+        self.lang = None
+        self.result = None
+        self.languages = None
+        self.templates = {}
+        self.cells = {}
+
+        self.analysis_header = self.addCell(layout, header=True)
+        for key in self.analysis_keys:
+            self.cells[key] = self.addCell(layout)
+        self.statistic_header = self.addCell(layout, header=True)
+        for key in self.statistic_keys:
+            self.cells[key] = self.addCell(layout)
+        self.app_label = self.addCell(layout)
+        self.app_label.setObjectName("rs-text")
+
+    def addCell(self, layout, header=False):
+        label = QLabel(self)
+        label.setTextFormat(Qt.PlainText)
+        label.setProperty("header", header)
+        layout.addWidget(label)
+        return label
+
+    def setLanguage(self, lang):
+        self.lang = lang
+        self.templates = {
+            key: translations[lang][key]
+            for key in self.analysis_keys + self.statistic_keys
+        }
+        self.analysis_header.setText(translations[lang]["analysis"])
+        self.statistic_header.setText(translations[lang]["statistic"])
+        self.app_label.setText(app.applicationDisplayName())
+        for label in self.cells.values():
+            label.setText("")
+
+    def setStatistics(self, result, lang):
+        if lang == self.lang and result == self.result:
+            return
+        if lang != self.lang:
+            self.setLanguage(lang)
+        self.result = result
+
+        has_analysis = result.word_count > 0 and result.character_count > 0
+        values = {
+            "statistic_message_1": result.line_count,
+            "statistic_message_2": result.word_count,
+            "statistic_message_3": result.character_count,
+        }
+        if has_analysis:
+            values["analysis_message_1"] = "{:.1f}".format(result.averageWordLength())
+            values["analysis_message_2"] = "{:.1f}".format(result.averageLineLength())
+            values["analysis_message_3"] = result.uppercase_count
+            values["analysis_message_4"] = result.lowercase_count
+            language = self.languages or result.language
+            if language:
+                values["analysis_message_5"] = language
+
+        self.analysis_header.setVisible(has_analysis)
+        for key, label in self.cells.items():
+            if key not in values:
+                label.setVisible(False)
+                continue
+            text = self.templates[key].format(values[key])
+            if label.text() != text:
+                label.setText(text)
+            label.setVisible(True)
+
+    def setLanguages(self, summary):
+        self.languages = summary
+        if self.result is not None:
+            result, self.result = self.result, None
+            self.setStatistics(result, self.lang)
+
+
+class SW_LargeFileView(QAbstractScrollArea):
+    def __init__(self, mapped_file, parent=None):
+        super(SW_LargeFileView, self).__init__(parent)
+        self.mapped_file = mapped_file
+        self.match_line = None
+        self.match_offset = -1
+
+        self.setFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
+        self.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.verticalScrollBar().valueChanged.connect(self.viewport().update)
+
+        self.indexer = MappedFileIndexer(mapped_file, self)
+        self.indexer.progress.connect(self.updateRange)
+        self.indexer.start()
+        self.updateRange()
+
+    def visibleLines(self):
+        return max(1, self.viewport().height() // self.fontMetrics().lineSpacing())
+
+    def updateRange(self, *args):
+        page = self.visibleLines()
+        self.verticalScrollBar().setPageStep(page)
+        self.verticalScrollBar().setRange(0, max(0, self.mapped_file.line_count - page))
+        self.viewport().update()
+
+    def resizeEvent(self, event):
+        super(SW_LargeFileView, self).resizeEvent(event)
+        self.updateRange()
+
+    def paintEvent(self, event):
+        painter = QPainter(self.viewport())
+        painter.fillRect(self.viewport().rect(), self.palette().base())
+        metrics = self.fontMetrics()
+        first = self.verticalScrollBar().value()
+        lines = self.mapped_file.lines(first, self.visibleLines() + 1)
+
+        for i, text in enumerate(lines):
+            top = i * metrics.lineSpacing()
+            if first + i == self.match_line:
+                painter.fillRect(
+                    0,
+                    top,
+                    self.viewport().width(),
+                    metrics.lineSpacing(),
+                    self.palette().highlight(),
+                )
+            painter.setPen(self.palette().text().color())
+            painter.drawText(4, top + metrics.ascent(), text.expandtabs(4))
+
+    def find(self, text):
+        if not text:
+            return False
+        offset = self.mapped_file.find(text, self.match_offset + 1)
+        if offset < 0:
+            offset = self.mapped_file.find(text)
+        if offset < 0:
+            return False
+
+        self.match_offset = offset
+        self.match_line = self.mapped_file.lineAt(offset)
+        self.verticalScrollBar().setValue(self.match_line - self.visibleLines() // 2)
+        self.viewport().update()
+        return True
+
+    def close(self):
+        self.indexer.requestInterruption()
+        self.indexer.wait()
+        self.mapped_file.close()
+        super(SW_LargeFileView, self).close()
+
+
+class SW_Workspace(QMainWindow):
+    ready = Signal()
+
+    def __init__(self, startup_timer=None, parent=None):
         super(SW_Workspace, self).__init__(parent)
-        QTimer.singleShot(0, self.initUI)
+        self.startup_timer = startup_timer or StageTimer()
+        self.first_frame = False
+        self.initUI()
+
+    def paintEvent(self, event):
+        super(SW_Workspace, self).paintEvent(event)
+        if not self.first_frame:
+            self.first_frame = True
+            # Queued so the whole window is flushed before handing over
+            QTimer.singleShot(0, self.firstFrame)
+
+    def firstFrame(self):
+        self.startup_timer.mark("frame")
+        self.ready.emit()
 
     def initUI(self):
-        starttime = datetime.datetime.now()
         self.setWindowIcon(QIcon(fallbackValues["icon"]))
         self.setWindowModality(Qt.WindowModality.ApplicationModal)
         self.setMinimumSize(768, 540)
@@ -231,59 +408,109 @@ class SW_Workspace(QMainWindow):
         layout.addWidget(self.hardwareAcceleration)
         self.setCentralWidget(centralWidget)
 
-        self.solidwriting_thread = ThreadingEngine(
-            adaptiveResponse=settings.value("adaptiveResponse")
-        )
-        self.solidwriting_thread.update.connect(self.updateStatistics)
-
         self.themePalette()
         self.selected_file = None
         self.file_name = None
+        self.file_encoding = None
+        self.encoding_fallback = None
+        self.large_file_view = None
         self.is_saved = None
         self.default_directory = QDir().homePath()
         self.directory = self.default_directory
         self.llm = None
-        self.hardwareCore = self.acceleratorHardware()
+        self.hardwareCore = None
+        self.hardware_probe = HardwareProbe(
+            settings.value("hardwareFingerprint"), settings.value("hardwareCore"), self
+        )
+        self.hardware_probe.detected.connect(self.hardwareDetected)
 
         self.LLMinitDock()
         self.ai_widget.hide()
 
         self.status_bar = self.statusBar()
+        self.statistics_label = SW_Statistics(self)
+        self.status_bar.addPermanentWidget(self.statistics_label)
+        self.document_loader = None
+        self.session_restorer = None
+        self.restore_scroll = None
+        self.restore_scroll_timer = QTimer(self)
+        self.restore_scroll_timer.setSingleShot(True)
+        self.restore_scroll_timer.setInterval(
+            int(250 * float(settings.value("adaptiveResponse")))
+        )
+        self.restore_scroll_timer.timeout.connect(self.restoreScrolled)
+        self.document_saver = DocumentSaver(self)
+        self.document_saver.saved.connect(self.savingFinished)
+        self.document_saver.failed.connect(self.savingFailed)
+        self.loading_progress = QProgressBar(self)
+        self.loading_progress.setRange(0, 100)
+        self.loading_progress.setMaximumWidth(200)
+        self.loading_cancel = QPushButton(translations[lang]["cancel"], self)
+        self.loading_cancel.clicked.connect(self.cancelLoading)
+        self.status_bar.addWidget(self.loading_progress)
+        self.status_bar.addWidget(self.loading_cancel)
+        self.loading_progress.hide()
+        self.loading_cancel.hide()
         self.DocumentArea = QTextEdit()
         self.DocumentArea.setTextInteractionFlags(Qt.TextEditorInteraction)
         self.DocumentArea.setContextMenuPolicy(Qt.CustomContextMenu)
         self.DocumentArea.customContextMenuRequested.connect(self.showContextMenu)
+        self.DocumentArea.verticalScrollBar().rangeChanged.connect(
+            self.restoreRangeChanged
+        )
+        self.statistics_engine = StatisticsEngine(self.DocumentArea.document(), self)
+        self.statistics_result = None
+
+        self.statistics_scheduler = StatisticsScheduler(
+            adaptiveResponse=settings.value("adaptiveResponse"),
+            statistics_engine=self.statistics_engine,
+            parent=self,
+        )
+        self.statistics_scheduler.ready.connect(self.updateStatistics)
+
+        self.language_indexer = LanguageIndexer(
+            self.DocumentArea.document(),
+            adaptiveResponse=settings.value("adaptiveResponse"),
+            parent=self,
+        )
+        self.language_indexer.distributionChanged.connect(
+            self.statistics_label.setLanguages
+        )
+
+        self.autosave_journal = AutosaveJournal(
+            self.DocumentArea.document(),
+            autosaveDirectory(),
+            adaptiveResponse=settings.value("adaptiveResponse"),
+            parent=self,
+        )
+        self.autosave_journal.committed.connect(
+            lambda snapshot: settings.setValue("autosave", snapshot)
+        )
 
         self.initArea()
         layout.addWidget(self.DocumentArea)
+        self.startup_timer.mark("workspace")
 
         self.DocumentArea.setDisabled(True)
         self.initActions()
+        self.startup_timer.mark("actions")
         self.initToolbar()
+        self.startup_timer.mark("toolbars")
         self.adaptiveResponse = settings.value("adaptiveResponse")
 
-        self.setPalette(self.light_theme)
-        self.text_changed_timer = QTimer()
-        self.text_changed_timer.setInterval(150 * self.adaptiveResponse)
-        self.text_changed_timer.timeout.connect(self.threadStart)
-        self.DocumentArea.textChanged.connect(self.textChanged)
-        self.thread_running = False
+        # Themed before the first frame, so the window never flashes light
+        self.restoreTheme()
+        self.startup_timer.mark("theme")
+
+        self.ready.connect(self.restoreState)
+        self.ready.connect(self.hardware_probe.start)
 
         self.showMaximized()
         self.DocumentArea.setFocus()
         self.DocumentArea.setAcceptRichText(True)
 
-        QTimer.singleShot(50 * self.adaptiveResponse, self.restoreTheme)
-        QTimer.singleShot(150 * self.adaptiveResponse, self.restoreState)
-
         self.DocumentArea.setDisabled(False)
         self.updateTitle()
-        endtime = datetime.datetime.now()
-        self.status_bar.showMessage(
-            str((endtime - starttime).total_seconds()) + " ms", 2500
-        )
-        if self.hardwareCore == "cpu":
-            self.LLMwarningCPU()
 
     def showContextMenu(self, pos):
         selected_text = self.DocumentArea.textCursor().selectedText().strip()
@@ -418,6 +645,7 @@ class SW_Workspace(QMainWindow):
 
     def closeEvent(self, event):
         lang = settings.value("appLanguage")
+        self.document_saver.flush()
         if self.is_saved == False:
             reply = QMessageBox.question(
                 self,
@@ -429,12 +657,16 @@ class SW_Workspace(QMainWindow):
 
             if reply == QMessageBox.Yes:
                 self.saveState()
+                self.statistics_scheduler.stop()
+                self.closeLargeFile()
                 event.accept()
             else:
                 self.saveState()
                 event.ignore()
         else:
             self.saveState()
+            self.statistics_scheduler.stop()
+            self.closeLargeFile()
             event.accept()
 
     def changeLanguage(self):
@@ -448,7 +680,9 @@ class SW_Workspace(QMainWindow):
         lang = settings.value("appLanguage")
 
         file = self.file_name if self.file_name else translations[lang]["new"]
-        textMode = translations[lang]["readonly"] if file.endswith(".docx") else ""
+        textMode = (
+            translations[lang]["readonly"] if self.large_file_view is not None else ""
+        )
 
         if len(textMode) == 0:
             asterisk = "*" if not self.is_saved else ""
@@ -459,93 +693,19 @@ class SW_Workspace(QMainWindow):
             f"{file}{asterisk}{textMode} — {app.applicationDisplayName()}"
         )
 
-    def threadStart(self):
-        if not self.thread_running:
-            self.solidwriting_thread.start()
-            self.thread_running = True
-
-    def textChanged(self):
-        if not self.text_changed_timer.isActive():
-            self.text_changed_timer.start()
-
-    def updateStatistics(self):
-        self.text_changed_timer.stop()
-        self.thread_running = False
-        text = self.DocumentArea.toPlainText()
-
-        character_count = len(text)
-        word_count = len(text.split())
-        line_count = text.count("\n") + 1
-
-        avg_word_length = avg_line_length = uppercase_count = lowercase_count = None
-        detected_language = None
-        lang = settings.value("appLanguage")
-
-        if word_count > 0 and line_count > 0 and character_count > 0 and text != "":
-            avg_word_length = sum(len(word) for word in text.split()) / word_count
-            formatted_avg_word_length = "{:.1f}".format(avg_word_length)
-
-            avg_line_length = (character_count / line_count) - 1
-            formatted_avg_line_length = "{:.1f}".format(avg_line_length)
-
-            uppercase_count = sum(1 for char in text if char.isupper())
-            lowercase_count = sum(1 for char in text if char.islower())
-
-            if word_count > 20:
-                try:
-                    DetectorFactory.seed = 0
-                    detected_language = detect(text)
-                except Exception:
-                    detected_language = None
-
-        statistics = f"<html><head><style>"
-        statistics += "table {border-collapse: collapse; width: 100%;}"
-        statistics += "th, td {text-align: left; padding: 10px;}"
-        statistics += "tr:nth-child(even) {background-color: #f2f2f2;}"
-        statistics += ".highlight {background-color: #E2E3E1; color: #000000}"
-        statistics += "tr:hover {background-color: #ddd;}"
-        statistics += "th { background-color: #0379FF; color: white;}"
-        statistics += "td { color: white;}"
-        statistics += "#rs-text { background-color: #E2E3E1; color: #000000; }"
-        statistics += "</style></head><body>"
-
-        statistics += "<table><tr>"
-
-        if avg_word_length is not None:
-            statistics += f"<th>{translations[lang]['analysis']}</th>"
-            statistics += f"<td>{translations[lang]['analysis_message_1'].format(formatted_avg_word_length)}</td>"
-            statistics += f"<td>{translations[lang]['analysis_message_2'].format(formatted_avg_line_length)}</td>"
-            statistics += f"<td>{translations[lang]['analysis_message_3'].format(uppercase_count)}</td>"
-            statistics += f"<td>{translations[lang]['analysis_message_4'].format(lowercase_count)}</td>"
-            if detected_language:
-                statistics += f"<td>{translations[lang]['analysis_message_5'].format(detected_language)}</td>"
+    def updateStatistics(self, result=None):
+        if result is not None:
+            self.statistics_result = result
+        result = self.statistics_result
+        if result is None:
+            return
 
-        else:
+        if result.word_count == 0 or result.character_count == 0:
             self.resetDocumentArea()
 
-        statistics += f"<th>{translations[lang]['statistic']}</th>"
-        statistics += (
-            f"<td>{translations[lang]['statistic_message_1'].format(line_count)}</td>"
-        )
-        statistics += (
-            f"<td>{translations[lang]['statistic_message_2'].format(word_count)}</td>"
-        )
-        statistics += f"<td>{translations[lang]['statistic_message_3'].format(character_count)}</td>"
-
-        statistics += f"</td><th id='rs-text'>{app.applicationDisplayName()}</th>"
+        self.statistics_label.setStatistics(result, settings.value("appLanguage"))
 
-        statistics += "</tr></table></body></html>"
-
-        self.statistics_label.setText(statistics)
-
-        self.status_bar.addPermanentWidget(self.statistics_label)
-
-        self.new_text = self.DocumentArea.toPlainText()
-
-        if self.new_text != fallbackValues["content"]:
-            self.is_saved = False
-        else:
-            self.is_saved = True
+        self.is_saved = False
 
         self.updateTitle()
 
@@ -553,7 +713,8 @@ class SW_Workspace(QMainWindow):
         settings.setValue("windowScale", self.saveGeometry())
         settings.setValue("defaultDirectory", self.directory)
         settings.setValue("fileName", self.file_name)
-        settings.setValue("content", self.DocumentArea.toHtml())
+        self.autosave_journal.sync()
+        self.response_cache.sync()
         settings.setValue("isSaved", self.is_saved)
         settings.setValue(
             "scrollPosition", self.DocumentArea.verticalScrollBar().value()
@@ -568,7 +729,6 @@ class SW_Workspace(QMainWindow):
     def restoreState(self):
         geometry = settings.value("windowScale")
         self.directory = settings.value("defaultDirectory", self.default_directory)
-        self.DocumentArea.setHtml(settings.value("content"))
         self.is_saved = settings.value("isSaved")
         index = self.language_combobox.findData(lang)
         self.language_combobox.setCurrentIndex(index)
@@ -576,6 +736,11 @@ class SW_Workspace(QMainWindow):
         if geometry:
             self.restoreGeometry(geometry)
 
+        # Set before anything that can restore, since restores end in
+        # restoreLayout
+        scroll_position = settings.value("scrollPosition")
+        self.restore_scroll = int(scroll_position) if scroll_position is not None else 0
+
         if len(sys.argv) > 1:
             file_to_open = os.path.abspath(sys.argv[1])
             if os.path.exists(file_to_open):
@@ -584,18 +749,27 @@ class SW_Workspace(QMainWindow):
                 QMessageBox.warning(
                     self, "File Not Found", f"The file '{file_to_open}' does not exist."
                 )
-                return
+                # Falls through to the autosaved session
+                self.file_name = None
         else:
             self.file_name = settings.value("fileName")
 
+        # Older versions kept the whole document in the settings store; it
+        # goes on the first start either way
+        legacy_content = settings.value("content")
+        settings.remove("content")
+
+        # The last file replaces the autosaved session, so only one is loaded
         if self.file_name and os.path.exists(self.file_name):
             self.openFile(self.file_name)
-
-        scroll_position = settings.value("scrollPosition")
-        if scroll_position is not None:
-            self.DocumentArea.verticalScrollBar().setValue(int(scroll_position))
         else:
-            self.DocumentArea.verticalScrollBar().setValue(0)
+            self.restoreSession(legacy_content)
+
+        if self.session_restorer is None:
+            if self.isLoading():
+                self.document_loader.finished.connect(self.restoreLoaded)
+            else:
+                self.restoreLoaded()
 
         self.is_saved = bool(self.file_name)
 
@@ -603,6 +777,86 @@ class SW_Workspace(QMainWindow):
         self.restoreTheme()
         self.updateTitle()
 
+    def restoreSession(self, legacy_content=None):
+        self.session_restorer = self.autosave_journal.restorer(
+            settings.value("autosave")
+        )
+        if self.session_restorer is None:
+            self.autosave_journal.pause()
+            if legacy_content:
+                self.DocumentArea.setHtml(legacy_content)
+            self.autosave_journal.resume()
+            return
+
+        self.session_restorer.restored.connect(self.sessionRestored)
+        self.session_restorer.failed.connect(self.sessionFailed)
+        self.session_restorer.finished.connect(self.session_restorer.deleteLater)
+        self.DocumentArea.setReadOnly(True)
+        self.loading_progress.setRange(0, 0)
+        self.loading_progress.show()
+        self.session_restorer.start()
+
+    def sessionRestored(self, document, generation, last):
+        if self.session_restorer is None:
+            return
+        self.sessionDone()
+        self.startup_timer.mark("load")
+
+        previous = self.DocumentArea.document()
+        document.setDocumentMargin(previous.documentMargin())
+        document.setDefaultFont(previous.defaultFont())
+        document.setDefaultTextOption(previous.defaultTextOption())
+        document.setParent(self.DocumentArea)
+
+        # Everything following the document moves over before setDocument()
+        # deletes the previous one
+        self.statistics_engine.setDocument(document)
+        self.language_indexer.setDocument(document)
+        self.autosave_journal.adopt(document, generation, last)
+        self.DocumentArea.setDocument(document)
+        self.startup_timer.mark("swap")
+        self.restoreLayout()
+
+    def sessionFailed(self, message):
+        if self.session_restorer is None:
+            return
+        self.sessionDone()
+        self.autosave_journal.compact()
+        self.status_bar.showMessage(message, 5000)
+
+    def sessionDone(self):
+        self.session_restorer = None
+        self.DocumentArea.setReadOnly(False)
+        self.loading_progress.hide()
+
+    def restoreLoaded(self, *args):
+        self.startup_timer.mark("load")
+        self.restoreLayout()
+
+    def restoreLayout(self):
+        if self.restore_scroll is None:
+            return
+        if self.DocumentArea.verticalScrollBar().maximum() >= self.restore_scroll:
+            self.restoreScrolled()
+        else:
+            # Long documents keep laying out after loading, growing the range
+            self.restore_scroll_timer.start()
+
+    def restoreRangeChanged(self, minimum, maximum):
+        if self.restore_scroll is None or not self.restore_scroll_timer.isActive():
+            return
+        if maximum >= self.restore_scroll:
+            self.restoreScrolled()
+        else:
+            self.restore_scroll_timer.start()
+
+    def restoreScrolled(self):
+        self.restore_scroll_timer.stop()
+        self.DocumentArea.verticalScrollBar().setValue(self.restore_scroll)
+        self.restore_scroll = None
+        self.startup_timer.mark("layout")
+        self.status_bar.showMessage(self.startup_timer.summary(), 5000)
+
     def restoreTheme(self):
         if settings.value("appTheme") == "dark":
             self.setPalette(self.dark_theme)
@@ -759,7 +1013,7 @@ class SW_Workspace(QMainWindow):
             model_path = os.path.join(current_directory, model_filename)
 
             if os.path.exists(model_path):
-                if torch.accelerator.is_available() == False:
+                if self.hardwareCore in (None, "cpu"):
                     # max_memory = torch.cuda.get_device_properties(0).total_memory / (
                     #     1024**2
                     # )  # x MB VRAM
@@ -770,7 +1024,7 @@ class SW_Workspace(QMainWindow):
                         1024**2
                     )  # 4096 MB
 
-                self.llm = Llama(
+                self.llm = llama_cpp.Llama(
                     model_path,
                     n_gpu_layers=-1,
                     split_mode=0,
@@ -781,6 +1035,8 @@ class SW_Workspace(QMainWindow):
                     device_map="auto",
                     verbose=True,
                 )
+                self.llm_model = modelFingerprint(model_path)
+                self.llm_worker.setModel(self.llm)
 
             else:
                 self.llm = None
@@ -789,21 +1045,14 @@ class SW_Workspace(QMainWindow):
         except Exception as e:
             print(f"{str(e)}")
 
-    def acceleratorHardware(self):
-        if torch.cuda.is_available():  # NVIDIA
-            QTimer.singleShot(500, self.loadLLM)
-            return "cuda"
-        elif torch.is_vulkan_available():
-            QTimer.singleShot(500, self.loadLLM)
-            return "vulkan"
-        elif torch.backends.mps.is_available():  # Metal API
-            QTimer.singleShot(500, self.loadLLM)
-            return "mps"
-        elif hasattr(torch.backends, "rocm"):  # AMD
+    def hardwareDetected(self, hardwareCore, fingerprint):
+        self.hardwareCore = hardwareCore
+        settings.setValue("hardwareCore", hardwareCore)
+        settings.setValue("hardwareFingerprint", fingerprint)
+        if self.hardwareCore == "cpu":
+            self.LLMwarningCPU()
+        else:
             QTimer.singleShot(500, self.loadLLM)
-            return "rocm"
-        else:  # CPU
-            return "cpu"
 
     def LLMwarningCPU(self):
         message = (
@@ -829,7 +1078,6 @@ class SW_Workspace(QMainWindow):
             self.ai_widget.setWidget(QLabel("GPU/NPU not available."))
 
     def LLMinitDock(self):
-        self.statistics_label = QLabel()
         self.ai_widget = QDockWidget("AI", self)
         self.ai_widget.setObjectName("AI")
         self.ai_widget.setAllowedAreas(Qt.LeftDockWidgetArea | Qt.RightDockWidgetArea)
@@ -849,6 +1097,22 @@ class SW_Workspace(QMainWindow):
         self.predict_button.clicked.connect(self.LLMpredict)
         main_layout.addWidget(self.predict_button)
 
+        self.stop_button = QPushButton("Stop")
+        self.stop_button.setEnabled(False)
+        self.stop_button.clicked.connect(self.LLMstop)
+        main_layout.addWidget(self.stop_button)
+
+        self.new_chat_button = QPushButton("New chat")
+        self.new_chat_button.clicked.connect(self.LLMnewChat)
+        main_layout.addWidget(self.new_chat_button)
+
+        self.llm_queue_label = QLabel()
+        self.llm_queue_label.hide()
+        main_layout.addWidget(self.llm_queue_label)
+
+        self.llm_cache_label = QLabel()
+        main_layout.addWidget(self.llm_cache_label)
+
         self.scrollableArea.setVerticalScrollBarPolicy(Qt.ScrollBarAsNeeded)
         self.scrollableArea.setHorizontalScrollBarPolicy(Qt.ScrollBarAsNeeded)
         self.scrollableArea.setWidgetResizable(True)
@@ -866,28 +1130,46 @@ class SW_Workspace(QMainWindow):
             QDockWidget.NoDockWidgetFeatures | QDockWidget.DockWidgetClosable
         )
 
-    def LLMmessage(self, text, is_user=True, typing_speed=100):
-        DetectorFactory.seed = 0
-
-        language = ""
-
-        if len(text) > 30:
-            language = detect(text)
-
-        current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.llm_worker = LLMWorker(parent=self)
+        self.llm_worker.requestStarted.connect(self.LLMrequestStarted)
+        self.llm_worker.chunk.connect(self.LLMstreamChunk)
+        self.llm_worker.result.connect(self.LLMhandleResponse)
+        self.llm_worker.requestCancelled.connect(self.LLMrequestCancelled)
+        self.llm_worker.queueChanged.connect(self.LLMqueueChanged)
+        self.llm_requests = {}
+        self.llm_session = ChatSession()
+        self.llm_model = None
+
+        # Context actions on an unchanged selection answer from here
+        cache_path = None
+        if str(settings.value("responseCacheDisk", "true")).lower() == "true":
+            cache_path = os.path.join(
+                QStandardPaths.writableLocation(QStandardPaths.AppDataLocation),
+                "responses.json",
+            )
+        self.response_cache = ResponseCache(cache_path, parent=self)
+        self.response_cache.changed.connect(self.LLMcacheChanged)
+        self.LLMcacheChanged()
+
+        # Streamed chunks are rendered at most once per interval
+        self.stream_dirty = set()
+        self.stream_timer = QTimer(self)
+        self.stream_timer.setSingleShot(True)
+        self.stream_timer.setInterval(
+            int(30 * float(settings.value("adaptiveResponse")))
+        )
+        self.stream_timer.timeout.connect(self.LLMstreamRender)
 
-        text = text.replace("\n", "<br>")
-        text = self.LLMconvertMarkdownHTML(text)
+    def LLMmessage(self, text, is_user=True):
+        message_label = self.LLMbubble(is_user)
+        message_label.setText(self.LLMformatMessage(text))
+        self.LLMmessageDatetime(message_label)
 
+    def LLMbubble(self, is_user):
         message_widget = QWidget()
         message_layout = QHBoxLayout()
 
-        if language:
-            message_label_content = f"{text}<br><br>({current_time} - {language})"
-        else:
-            message_label_content = f"{text}<br><br>({current_time})"
-
-        message_label = QLabel(message_label_content)
+        message_label = QLabel()
         message_label.setWordWrap(True)
         message_label.setTextInteractionFlags(Qt.TextSelectableByMouse)
         message_label.setTextFormat(Qt.RichText)
@@ -909,41 +1191,99 @@ class SW_Workspace(QMainWindow):
         message_widget.setLayout(message_layout)
 
         self.messages_layout.addWidget(message_widget)
+        return message_label
 
-        if not is_user:
-            self.LLMdynamicMessage(
-                message_label, text, typing_speed * self.adaptiveResponse
-            )
+    def LLMformatMessage(self, text):
+        text = text.replace("\n", "<br>")
+        return self.LLMconvertMarkdownHTML(text)
+
+    def LLMsubmit(
+        self,
+        prompt,
+        priority=PRIORITY_NORMAL,
+        max_tokens=None,
+        session=None,
+        cache_key=None,
+    ):
+        # The worker only runs once a model is set, so the prompt would wait forever
+        if self.llm is None:
+            self.LLMmessage("The AI model is not loaded.", is_user=False)
+            return False
 
-        if is_user:
-            self.full_text = ""
+        request_id = self.llm_worker.submit(prompt, priority, max_tokens, session)
+        if request_id is None:
+            self.LLMmessage("The AI queue is full, please wait.", is_user=False)
+            return False
+
+        self.LLMmessage(prompt, is_user=True)
+        message_label = self.LLMbubble(is_user=False)
+        message_label.setText("...")
+        self.llm_requests[request_id] = {
+            "label": message_label,
+            "text": "",
+            "started": None,
+            "first_token": None,
+            "cache_key": cache_key,
+        }
+        return True
 
-    def LLMdynamicMessage(self, message_label, text, typing_speed):
-        words = text.split()
+    def LLMrequestStarted(self, request_id):
+        self.stop_button.setEnabled(True)
+        if request_id in self.llm_requests:
+            self.llm_requests[request_id]["started"] = time.perf_counter()
 
-        if not hasattr(self, "full_text"):
-            self.full_text = ""
+    def LLMstop(self):
+        self.stop_button.setEnabled(False)
+        self.llm_worker.cancelCurrent()
 
-        word_index = 0
+    def LLMstreamChunk(self, request_id, chunk):
+        request = self.llm_requests.get(request_id)
+        if request is None:
+            return
+        if request["first_token"] is None:
+            request["first_token"] = time.perf_counter() - request["started"]
+        request["text"] += chunk
+        self.stream_dirty.add(request_id)
+        if not self.stream_timer.isActive():
+            self.stream_timer.start()
+
+    def LLMstreamRender(self):
+        for request_id in self.stream_dirty:
+            request = self.llm_requests.get(request_id)
+            if request is not None:
+                request["label"].setText(self.LLMformatMessage(request["text"]))
+        self.stream_dirty.clear()
+
+    def LLMrequestCancelled(self, request_id):
+        request = self.llm_requests.pop(request_id, None)
+        if request is None:
+            return
+        if request["started"] is None:
+            request["label"].setText("Cancelled.")
+            return
 
-        def type_next_word():
-            nonlocal word_index
-            if word_index < len(words):
-                self.full_text += words[word_index] + " "
-                message_label.setText(self.full_text)
-                word_index += 1
-            else:
-                self.LLMmessageDatetime(message_label)
-                self.typing_timer.stop()
+        # Keep whatever was streamed before the stop
+        self.stop_button.setEnabled(False)
+        self.stream_dirty.discard(request_id)
+        request["label"].setText(
+            self.LLMformatMessage(request["text"]) + "<br><br>(Stopped)"
+            if request["text"]
+            else "Stopped."
+        )
+
+    def LLMcacheChanged(self):
+        self.llm_cache_label.setText(self.response_cache.summary())
 
-        self.typing_timer = QTimer(self)
-        self.typing_timer.timeout.connect(type_next_word)
-        self.typing_timer.start(typing_speed)
+    def LLMqueueChanged(self, waiting):
+        full = waiting >= self.llm_worker.queue_limit
+        self.llm_queue_label.setText(f"{waiting} queued" + (" (full)" if full else ""))
+        self.llm_queue_label.setVisible(waiting > 0)
+        self.predict_button.setEnabled(waiting < self.llm_worker.queue_limit)
 
     def LLMmessageDatetime(self, message_label):
         current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         language = (
-            detect(message_label.text()) if len(message_label.text()) > 30 else ""
+            detectText(message_label.text()) if len(message_label.text()) > 30 else ""
         )
 
         if language:
@@ -960,19 +1300,35 @@ class SW_Workspace(QMainWindow):
             self.LLMmessage("Please enter a question.", is_user=False)
             return
 
-        self.LLMmessage(prompt, is_user=True)
-        self.predict_button.setText("...")
-        self.predict_button.setEnabled(False)
+        if self.LLMsubmit(prompt, session=self.llm_session):
+            self.input_text.clear()
 
-        self.llm_thread = LLMThread(prompt, self.llm)
-        self.llm_thread.result.connect(self.LLMhandleResponse)
-        self.llm_thread.start()
+    def LLMnewChat(self):
+        # The worker may still be answering in the old session, so it is
+        # left to it rather than cleared
+        self.llm_session = ChatSession()
+        self.LLMmessage("New chat started.", is_user=False)
 
-    def LLMhandleResponse(self, response):
-        self.LLMmessage(response, is_user=False)
-        self.input_text.clear()
-        self.predict_button.setText("->")
-        self.predict_button.setEnabled(True)
+    def LLMhandleResponse(self, request_id, response):
+        self.stop_button.setEnabled(False)
+        request = self.llm_requests.pop(request_id, None)
+        if request is None:
+            return
+        self.stream_dirty.discard(request_id)
+        request["label"].setText(self.LLMformatMessage(response))
+        self.LLMmessageDatetime(request["label"])
+        if (
+            request["cache_key"] is not None
+            and response.strip()
+            and not response.startswith("Error: ")
+        ):
+            self.response_cache.put(request["cache_key"], response)
+        if request["first_token"] is not None:
+            self.status_bar.showMessage(
+                f"First token {request['first_token']:.2f} s, "
+                f"response {time.perf_counter() - request['started']:.2f} s",
+                5000,
+            )
 
     def LLMcontextPredict(self, action_type):
         selected_text = self.DocumentArea.textCursor().selectedText().strip()
@@ -983,37 +1339,32 @@ class SW_Workspace(QMainWindow):
             prompt = selected_text
 
         self.ai_widget.show()
-        self.LLMmessage(prompt, is_user=True)
-        self.predict_button.setText("...")
-        self.predict_button.setEnabled(False)
 
         if not selected_text:
+            self.LLMmessage(prompt, is_user=True)
             self.LLMmessage("No text selected.", is_user=False)
             return
 
-        self.llm_thread = LLMThread(prompt, self.llm)
-        self.llm_thread.result.connect(self.LLMhandleResponse)
-        self.llm_thread.start()
-
-    def LLMprompt(self, prompt):
-        if prompt:
-            response = self.LLMresponse(prompt)
+        max_tokens = ACTION_MAX_TOKENS.get(action_type)
+        cache_key = self.response_cache.key(
+            self.llm_model,
+            action_type,
+            dict(SAMPLING_PARAMS, max_tokens=max_tokens),
+            selected_text,
+        )
+        response = self.response_cache.get(cache_key)
+        if response is not None:
+            self.LLMmessage(prompt, is_user=True)
             self.LLMmessage(response, is_user=False)
-            self.input_text.clear()
-        else:
-            self.LLMmessage("Please enter a question.", is_user=False)
-
-        self.predict_button.setText("->")
-        self.predict_button.setEnabled(True)
+            self.status_bar.showMessage("Cached response", 5000)
+            return
 
-    def LLMresponse(self, prompt):
-        try:
-            response = self.llm.create_chat_completion(
-                messages=[{"role": "user", "content": prompt}]
-            )
-            return response["choices"][0]["message"]["content"]
-        except Exception as e:
-            return str(e)
+        self.LLMsubmit(
+            prompt,
+            ACTION_PRIORITIES.get(action_type, PRIORITY_NORMAL),
+            max_tokens,
+            cache_key=cache_key,
+        )
 
     def LLMconvertMarkdownHTML(self, markdown_text):
         markdown_text = self.LLMconvertCodeHTML(markdown_text)
@@ -1299,7 +1650,7 @@ class SW_Workspace(QMainWindow):
         adaptiveResponse = settings.value(
             "adaptiveResponse", fallbackValues["adaptiveResponse"]
         )
-        self.powersaveraction.setChecked(adaptiveResponse > 1)
+        self.powersaveraction.setChecked(float(adaptiveResponse) > 1)
 
         self.hide_ai_dock = self.createAction(
             "AI", "AI", self.toggleDock, QKeySequence("Ctrl+Shift+D"), ""
@@ -1368,18 +1719,20 @@ class SW_Workspace(QMainWindow):
         else:
             self.adaptiveResponse = fallbackValues["adaptiveResponse"]
 
+        self.statistics_scheduler.setAdaptiveResponse(self.adaptiveResponse)
+        self.language_indexer.setAdaptiveResponse(self.adaptiveResponse)
+        self.autosave_journal.setAdaptiveResponse(self.adaptiveResponse)
         settings.setValue("adaptiveResponse", self.adaptiveResponse)
         settings.sync()
 
-    def detectEncoding(file_path):
-        with open(file_path, "rb") as file:
-            detector = chardet.universaldetector.UniversalDetector()
-            for line in file:
-                detector.feed(line)
-                if detector.done:
-                    break
-            detector.close()
-        return detector.result["encoding"]
+    def saveEncoding(self):
+        override = settings.value("saveEncoding", fallbackValues["saveEncoding"])
+        return override or self.file_encoding or "utf-8"
+
+    def encodingByteLimit(self):
+        return int(
+            settings.value("encodingByteLimit", fallbackValues["encodingByteLimit"])
+        )
 
     def resetDocumentArea(self):
         self.DocumentArea.clear()
@@ -1397,9 +1750,13 @@ class SW_Workspace(QMainWindow):
 
     def newFile(self):
         if self.is_saved:
+            self.closeLargeFile()
             self.resetDocumentArea()
             self.directory = self.default_directory
             self.file_name = None
+            self.file_encoding = None
+            self.encoding_fallback = None
+            self.autosave_journal.setFile(None)
             self.is_saved = False
             self.updateTitle()
         else:
@@ -1412,6 +1769,7 @@ class SW_Workspace(QMainWindow):
             )
 
             if reply == QMessageBox.Yes:
+                self.closeLargeFile()
                 self.resetDocumentArea()
 
     def openFile(self, file_to_open=None):
@@ -1430,34 +1788,134 @@ class SW_Workspace(QMainWindow):
             )
 
         if selected_file:
+            self.cancelLoading()
+            self.closeLargeFile()
             self.file_name = selected_file
-            try:
-                automaticEncoding = SW_Workspace.detectEncoding(self.file_name)
-            except Exception as e:
-                automaticEncoding = "utf-8"
-
-            if self.file_name.endswith(".docx"):
-                with open(self.file_name, "rb") as file:
-                    try:
-                        conversionLayer = mammoth.convert_to_html(file)
-                        self.DocumentArea.setHtml(conversionLayer.value)
-                    except Exception as e:
-                        QMessageBox.warning(self, None, "Conversion failed.")
-            else:
-                with open(self.file_name, "r", encoding=automaticEncoding) as file:
-                    if self.file_name.endswith((".swdoc")):
-                        self.DocumentArea.setHtml(file.read())
-                    elif self.file_name.endswith((".html", ".htm")):
-                        self.DocumentArea.setHtml(file.read())
-                    elif self.file_name.endswith((".md")):
-                        self.DocumentArea.setMarkdown(file.read())
-                    else:
-                        self.DocumentArea.setPlainText(file.read())
+            self.encoding_fallback = None
+
+            if not (
+                self.isLargeFile(self.file_name) and self.openLargeFile(self.file_name)
+            ):
+                self.loadFile(self.file_name)
 
             self.directory = os.path.dirname(self.file_name)
             self.is_saved = True
             self.updateTitle()
 
+    def loadFile(self, file_name):
+        if file_name.endswith((".swdoc")):
+            mode = "html"
+        elif file_name.endswith((".html", ".htm")):
+            mode = "html"
+        elif file_name.endswith((".md")):
+            mode = "markdown"
+        elif file_name.endswith(".docx"):
+            mode = "docx"
+        else:
+            mode = "plain"
+
+        if mode == "docx":
+            self.document_loader = DocxLoader(
+                self.DocumentArea.document(), file_name, self
+            )
+            self.document_loader.report.connect(
+                lambda message: self.status_bar.showMessage(message, 5000)
+            )
+            self.loading_progress.setRange(0, 0)
+        else:
+            self.document_loader = DocumentLoader(
+                self.DocumentArea.document(),
+                file_name,
+                mode,
+                self.encodingByteLimit(),
+                self,
+            )
+            self.document_loader.fallback.connect(self.loadingFallback)
+            self.loading_progress.setRange(0, 100)
+        self.document_loader.progress.connect(self.loading_progress.setValue)
+        self.document_loader.finished.connect(self.loadingFinished)
+        self.document_loader.failed.connect(self.loadingFailed)
+        self.document_loader.cancelled.connect(self.loadingCancelled)
+
+        self.autosave_journal.pause()
+        self.DocumentArea.setReadOnly(True)
+        self.loading_progress.setValue(0)
+        self.loading_progress.show()
+        self.loading_cancel.show()
+        self.document_loader.start()
+
+    def isLargeFile(self, file_name):
+        if file_name.endswith((".docx", ".swdoc", ".html", ".htm", ".md")):
+            return False
+        threshold = int(
+            settings.value("largeFileThreshold", fallbackValues["largeFileThreshold"])
+        )
+        return os.path.getsize(file_name) >= threshold
+
+    def openLargeFile(self, file_name):
+        with open(file_name, "rb") as file:
+            encoding, _ = detectEncoding(file, self.encodingByteLimit())
+        # The line index works on single-byte newlines
+        if encoding.startswith(("utf-16", "utf-32")):
+            return False
+
+        self.resetDocumentArea()
+        self.file_encoding = encoding
+        self.large_file_view = SW_LargeFileView(MappedFile(file_name, encoding), self)
+        self.DocumentArea.parentWidget().layout().addWidget(self.large_file_view)
+        self.DocumentArea.hide()
+        self.large_file_view.setFocus()
+        return True
+
+    def closeLargeFile(self):
+        if self.large_file_view is None:
+            return
+        self.large_file_view.close()
+        self.large_file_view.deleteLater()
+        self.large_file_view = None
+        self.DocumentArea.show()
+
+    def isLoading(self):
+        if self.session_restorer is not None:
+            return True
+        return self.document_loader is not None and self.document_loader.isLoading()
+
+    def cancelLoading(self):
+        if self.session_restorer is not None:
+            self.sessionDone()
+        if self.document_loader is not None:
+            self.document_loader.cancel()
+
+    def loadingDone(self):
+        self.autosave_journal.resume(self.file_name, self.file_encoding)
+        self.DocumentArea.setReadOnly(False)
+        self.loading_progress.hide()
+        self.loading_cancel.hide()
+
+    def loadingFinished(self, encoding):
+        self.file_encoding = encoding
+        self.loadingDone()
+        self.is_saved = True
+        self.updateTitle()
+
+    def loadingFallback(self, encoding):
+        self.encoding_fallback = encoding
+
+    def loadingFailed(self, message):
+        self.file_name = None
+        self.file_encoding = None
+        self.loadingDone()
+        self.updateTitle()
+        QMessageBox.warning(self, None, message)
+
+    def loadingCancelled(self):
+        self.resetDocumentArea()
+        self.file_name = None
+        self.file_encoding = None
+        self.loadingDone()
+        self.is_saved = False
+        self.updateTitle()
+
     def saveFile(self):
         if self.is_saved == False:
             self.saveProcess()
@@ -1466,7 +1924,20 @@ class SW_Workspace(QMainWindow):
         else:
             self.saveProcess()
 
+    def canSave(self):
+        # Refused up front, before saveAs changes the file name
+        if self.large_file_view is not None:
+            message = "This file is open read-only and cannot be saved."
+        elif self.isLoading():
+            message = "The document is still loading, please save once it is done."
+        else:
+            return True
+        QMessageBox.warning(self, app.applicationDisplayName(), message)
+        return False
+
     def saveAs(self):
+        if not self.canSave():
+            return False
         options = QFileDialog.Options()
         options |= QFileDialog.ReadOnly
         selected_file, _ = QFileDialog.getSaveFileName(
@@ -1485,30 +1956,48 @@ class SW_Workspace(QMainWindow):
             return False
 
     def saveProcess(self):
+        if not self.canSave():
+            return
         if not self.file_name:
             self.saveAs()
         else:
-            try:
-                automaticEncoding = SW_Workspace.detectEncoding(self.file_name)
-            except Exception as e:
-                automaticEncoding = "utf-8"
-            if self.file_name.lower().endswith(".docx"):
-                None
-            else:
-                with open(self.file_name, "w", encoding=automaticEncoding) as file:
-                    if self.file_name.lower().endswith((".swdoc", ".html", ".htm")):
-                        file.write(self.DocumentArea.toHtml())
-                    elif self.file_name.lower().endswith((".md")):
-                        file.write(self.DocumentArea.toMarkdown())
-                    else:
-                        document = QTextDocument()
-                        document.setPlainText(self.DocumentArea.toPlainText())
-                        file.write(document.toPlainText())
+            automaticEncoding = self.saveEncoding()
+            if not self.confirmEncodingFallback(automaticEncoding):
+                return
+            self.document_saver.save(
+                self.DocumentArea.document(), self.file_name, automaticEncoding
+            )
+            self.file_encoding = automaticEncoding
+            self.autosave_journal.setFile(self.file_name, self.file_encoding)
 
-        self.status_bar.showMessage("Saved.", 2000)
         self.is_saved = True
         self.updateTitle()
 
+    def confirmEncodingFallback(self, encoding):
+        if self.encoding_fallback is None:
+            return True
+        reply = QMessageBox.question(
+            self,
+            app.applicationDisplayName(),
+            f"Parts of this file were not valid {self.file_encoding} and were read "
+            f"as {self.encoding_fallback}. Saving rewrites them as {encoding}. "
+            "Save anyway?",
+            QMessageBox.Yes | QMessageBox.No,
+            QMessageBox.No,
+        )
+        if reply != QMessageBox.Yes:
+            return False
+        self.encoding_fallback = None
+        return True
+
+    def savingFinished(self, file_name, encoding):
+        self.status_bar.showMessage("Saved.", 2000)
+
+    def savingFailed(self, message):
+        self.is_saved = False
+        self.updateTitle()
+        QMessageBox.warning(self, None, message)
+
     def printDocument(self):
         printer = QPrinter(QPrinter.HighResolution)
         printer.setPageOrientation(QPageLayout.Orientation.Portrait)
@@ -1649,7 +2138,10 @@ class SW_Workspace(QMainWindow):
         self.find_dialog.show()
 
     def findText(self, text):
-        self.DocumentArea.find(text)
+        if self.large_file_view is not None:
+            self.large_file_view.find(text)
+        else:
+            self.DocumentArea.find(text)
 
     def replace(self):
         self.replace_dialog = QInputDialog(self)
@@ -1667,6 +2159,7 @@ class SW_Workspace(QMainWindow):
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     if getattr(sys, "frozen", False):
         applicationPath = sys._MEIPASS
     elif __file__:
@@ -1677,6 +2170,8 @@ if __name__ == "__main__":
     app.setApplicationName("SolidWriting")
     app.setApplicationDisplayName("SolidWriting 2025.02")
     app.setApplicationVersion("1.5.2025.02-2")
+    warmProfiles()
+    scheduleCachePruning()
     ws = SW_ControlInfo()
     ws.show()
     sys.exit(app.exec())
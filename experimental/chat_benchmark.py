@@ -0,0 +1,68 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import llama_cpp
+
+from modules.llm import ChatSession
+
+TURNS = [
+    "Write one sentence about the sea.",
+    "Now make it sound more formal.",
+    "Translate it to French.",
+    "Give me two synonyms for the main verb.",
+    "Summarize our conversation so far.",
+    "Suggest a title for a short story based on it.",
+]
+
+
+def promptEval(llm):
+    data = llama_cpp.llama_perf_context(llm._ctx.ctx)
+    return data.n_p_eval, data.t_p_eval_ms
+
+
+def runTurns(llm, reuse):
+    session = ChatSession()
+    results = []
+    for prompt in TURNS:
+        if not reuse:
+            # What every turn costs when the whole history is evaluated again
+            llm.reset()
+        llama_cpp.llama_perf_context_reset(llm._ctx.ctx)
+
+        messages = session.messages(llm, prompt, 64)
+        started = time.perf_counter()
+        first_token = None
+        response = []
+        for part in llm.create_chat_completion(
+            messages=messages, max_tokens=64, temperature=0, stream=True
+        ):
+            if first_token is None:
+                first_token = time.perf_counter() - started
+            content = part["choices"][0]["delta"].get("content")
+            if content:
+                response.append(content)
+        session.append(llm, prompt, "".join(response))
+
+        evaluated, eval_ms = promptEval(llm)
+        results.append((len(messages), evaluated, eval_ms, first_token or 0))
+    return results
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: chat_benchmark.py model.gguf")
+        sys.exit(1)
+
+    llm = llama_cpp.Llama(sys.argv[1], n_ctx=4096, n_gpu_layers=-1, verbose=False)
+    for reuse in (False, True):
+        print("prefix reuse" if reuse else "full re-evaluation")
+        for turn, (messages, evaluated, eval_ms, first_token) in enumerate(
+            runTurns(llm, reuse), 1
+        ):
+            print(
+                f"  turn {turn}: {messages:2} messages, {evaluated:5} tokens "
+                f"evaluated in {eval_ms:8.1f} ms, first token {first_token * 1000:8.1f} ms"
+            )
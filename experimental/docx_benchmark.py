@@ -0,0 +1,88 @@
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PySide6.QtCore import *
+from PySide6.QtGui import *
+from PySide6.QtWidgets import *
+
+from modules.document import DocumentSaver
+from modules.docx import writeDocx
+
+
+def buildDocument(paragraphs, images):
+    document = QTextDocument()
+    image = QImage(320, 240, QImage.Format_RGB32)
+    cursor = QTextCursor(document)
+    bold = QTextCharFormat()
+    bold.setFontWeight(QFont.Bold)
+
+    for i in range(images):
+        image.fill(QColor.fromHsv(i * 37 % 360, 200, 200))
+        document.addResource(
+            QTextDocument.ImageResource, QUrl(f"image://{i}"), image.copy()
+        )
+
+    for i in range(paragraphs):
+        cursor.insertText(f"Paragraph {i}: Lorem ipsum dolor sit amet, ")
+        cursor.insertText("consectetur adipiscing elit.", bold)
+        if images and i % max(1, paragraphs // images) == 0:
+            image_format = QTextImageFormat()
+            image_format.setName(f"image://{i * images // paragraphs}")
+            cursor.insertImage(image_format)
+        cursor.insertBlock()
+    return document
+
+
+def measure(function):
+    # Timed and traced separately, tracing slows Python code down a lot
+    started = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def writeHtml(document, file_path):
+    with open(file_path, "w", encoding="utf-8") as file:
+        file.write(document.toHtml())
+
+
+def savePath(document, file_path):
+    # What the editor runs: the GUI thread only takes the snapshot, the
+    # worker writes it
+    saver = DocumentSaver()
+    started = time.perf_counter()
+    saver.save(document, file_path, "utf-8")
+    blocked = time.perf_counter() - started
+    saver.flush()
+    return blocked, time.perf_counter() - started
+
+
+if __name__ == "__main__":
+    app = QApplication(sys.argv)
+    directory = tempfile.mkdtemp()
+
+    for paragraphs, images in [(1000, 10), (10000, 50), (50000, 100)]:
+        document = buildDocument(paragraphs, images)
+        docx_time, docx_peak = measure(
+            lambda: writeDocx(document, os.path.join(directory, "out.docx"))
+        )
+        html_time, html_peak = measure(
+            lambda: writeHtml(document, os.path.join(directory, "out.html"))
+        )
+        blocked, total = savePath(document, os.path.join(directory, "saved.docx"))
+        print(
+            f"{paragraphs:>6} paragraphs, {images:>3} images | "
+            f"docx {docx_time:6.2f} s, peak {docx_peak / 1024 ** 2:6.1f} MB | "
+            f"html {html_time:6.2f} s, peak {html_peak / 1024 ** 2:6.1f} MB | "
+            f"save {total:6.2f} s, GUI thread {blocked:6.2f} s"
+        )
@@ -0,0 +1,64 @@
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = [
+    "PySide6.QtWidgets",
+    "modules.globals",
+    "modules.statistics",
+    "modules.language",
+    "modules.document",
+    "modules.autosave",
+    "chardet",
+    "psutil",
+    "langdetect",
+    "mammoth",
+    "llama_cpp",
+    "modules.hardware",
+    "SolidWriting",
+]
+
+
+def importCost(module):
+    # A fresh interpreter per module, so nothing is already cached
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    elapsed = time.perf_counter() - started
+    if result.returncode != 0:
+        return None
+
+    heaviest = []
+    cumulative = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        own, total, name = line[len("import time:") :].split("|")
+        if not own.strip().isdigit():
+            continue
+        heaviest.append((int(own), name.strip()))
+        if name.strip() == module:
+            cumulative = int(total)
+    heaviest.sort(reverse=True)
+    return elapsed, cumulative / 1e6, heaviest[:3]
+
+
+if __name__ == "__main__":
+    for module in MODULES:
+        cost = importCost(module)
+        if cost is None:
+            print(f"{module:<20} not installed")
+            continue
+        elapsed, cumulative, heaviest = cost
+        print(
+            f"{module:<20} import {cumulative * 1000:8.1f} ms, "
+            f"process {elapsed * 1000:8.1f} ms | "
+            + ", ".join(f"{name} {own / 1000:.1f} ms" for own, name in heaviest)
+        )
@@ -0,0 +1,321 @@
+import json
+import os
+import re
+
+from PySide6.QtCore import *
+from PySide6.QtGui import *
+
+from modules.document import DocumentSaver, isRichFormat, replaceAtomic
+
+SNAPSHOT_PATTERN = re.compile(r"snapshot-(\d+)\.(html|txt|json)$")
+
+GENERATION_PATTERN = re.compile(r"(?:snapshot|journal)-(\d+)\.(?:html|txt|json|log)$")
+
+
+def autosaveDirectory():
+    return os.path.join(
+        QStandardPaths.writableLocation(QStandardPaths.AppDataLocation), "autosave"
+    )
+
+
+def snapshotPath(directory, generation, extension="html"):
+    return os.path.join(directory, f"snapshot-{generation}.{extension}")
+
+
+def journalPath(directory, generation):
+    return os.path.join(directory, f"journal-{generation}.log")
+
+
+def replayJournal(document, journal_path):
+    cursor = QTextCursor(document)
+    with open(journal_path, "r", encoding="utf-8") as file:
+        for line in file:
+            try:
+                position, removed, text = json.loads(line)
+            except ValueError:
+                # A torn final line from a crash mid-write
+                break
+            last = document.characterCount() - 1
+            cursor.setPosition(min(position, last))
+            cursor.setPosition(min(position + removed, last), QTextCursor.KeepAnchor)
+            cursor.insertText(text)
+
+
+def fileReference(file_path, encoding):
+    info = os.stat(file_path)
+    return {
+        "path": file_path,
+        "encoding": encoding,
+        "size": info.st_size,
+        "mtime": info.st_mtime_ns,
+    }
+
+
+def loadReference(document, reference_path):
+    with open(reference_path, "r", encoding="utf-8") as file:
+        reference = json.load(file)
+    file_path = reference["path"]
+    info = os.stat(file_path)
+    if info.st_size != reference["size"] or info.st_mtime_ns != reference["mtime"]:
+        raise ValueError(f"{file_path} changed since the session was saved")
+
+    # Decoded the way FileLoader read it, so the text matches the last session
+    with open(
+        file_path, "r", encoding=reference["encoding"], errors="singlebyte"
+    ) as file:
+        content = file.read()
+    if file_path.lower().endswith((".swdoc", ".html", ".htm")):
+        document.setHtml(content)
+    elif file_path.lower().endswith(".md"):
+        document.setMarkdown(content)
+    else:
+        document.setPlainText(content)
+
+
+class SessionRestorer(QThread):
+    restored = Signal(object, int, int)
+    failed = Signal(str)
+
+    def __init__(self, directory, snapshot_path, parent=None):
+        super(SessionRestorer, self).__init__(parent)
+        self.directory = directory
+        self.snapshot_path = snapshot_path
+        self.generation = int(SNAPSHOT_PATTERN.search(snapshot_path).group(1))
+
+    def run(self):
+        try:
+            # No layout here: it would cache font engines owned by this
+            # thread, which are gone once it finishes
+            document = QTextDocument()
+            if self.snapshot_path.endswith(".json"):
+                loadReference(document, self.snapshot_path)
+            else:
+                with open(self.snapshot_path, "r", encoding="utf-8") as file:
+                    if self.snapshot_path.endswith(".txt"):
+                        document.setPlainText(file.read())
+                    else:
+                        document.setHtml(file.read())
+
+            # Snapshots that never landed leave their journals chained after
+            # the last committed one
+            last = self.generation
+            while os.path.exists(journalPath(self.directory, last)):
+                replayJournal(document, journalPath(self.directory, last))
+                if not os.path.exists(journalPath(self.directory, last + 1)):
+                    break
+                last += 1
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+
+        document.moveToThread(QCoreApplication.instance().thread())
+        self.restored.emit(document, self.generation, last)
+
+
+class AutosaveJournal(QObject):
+    committed = Signal(str)
+
+    def __init__(
+        self,
+        document,
+        directory,
+        adaptiveResponse=1,
+        compact_size=1024 * 1024,
+        parent=None,
+    ):
+        super(AutosaveJournal, self).__init__(parent)
+        self.document = document
+        self.directory = directory
+        self.compact_size = compact_size
+        os.makedirs(self.directory, exist_ok=True)
+
+        # Generation n is snapshot-n.html followed by journal-n.log; a
+        # snapshot only becomes the restore point once it is on disk. New
+        # sessions leave a gap so they never extend an older chain
+        self.generation = self.newestGeneration() + 2
+        self.journal = None
+        self.journal_size = 0
+        self.operations = []
+        self.paused = False
+        # Anything journaled since the last snapshot; formatting only lives
+        # in snapshots
+        self.dirty = False
+        self.committed_generation = -1
+        self.file_path = None
+        self.encoding = None
+
+        self.saver = DocumentSaver(self)
+        self.saver.saved.connect(self.compacted)
+
+        self.flush_timer = QTimer(self)
+        self.flush_timer.setSingleShot(True)
+        self.flush_timer.timeout.connect(self.flush)
+        self.setAdaptiveResponse(adaptiveResponse)
+
+        self.document.contentsChange.connect(self.contentsChange)
+
+    def setDocument(self, document):
+        self.document.contentsChange.disconnect(self.contentsChange)
+        self.document = document
+        self.document.contentsChange.connect(self.contentsChange)
+
+    def setFile(self, file_path, encoding=None):
+        self.file_path = file_path
+        self.encoding = encoding
+
+    def setAdaptiveResponse(self, adaptiveResponse):
+        self.flush_timer.setInterval(int(1000 * float(adaptiveResponse)))
+
+    def generations(self):
+        for name in os.listdir(self.directory):
+            match = GENERATION_PATTERN.match(name)
+            if match:
+                yield int(match.group(1)), name
+
+    def newestGeneration(self):
+        return max((generation for generation, _ in self.generations()), default=-2)
+
+    def contentsChange(self, position, removed, added):
+        if self.paused:
+            return
+        end = min(position + added, self.document.characterCount() - 1)
+        cursor = QTextCursor(self.document)
+        cursor.setPosition(position)
+        cursor.setPosition(end, QTextCursor.KeepAnchor)
+        self.operations.append(json.dumps([position, removed, cursor.selectedText()]))
+        self.dirty = True
+        if not self.flush_timer.isActive():
+            self.flush_timer.start()
+
+    def write(self):
+        if not self.operations:
+            return
+        if self.journal is None:
+            self.journal = open(
+                journalPath(self.directory, self.generation), "a", encoding="utf-8"
+            )
+        data = "\n".join(self.operations) + "\n"
+        self.operations = []
+        self.journal.write(data)
+        self.journal.flush()
+        self.journal_size += len(data)
+
+    def flush(self):
+        self.write()
+        if self.journal_size > self.compact_size:
+            self.compact()
+
+    def compact(self):
+        self.write()
+        if self.journal is None:
+            # Keeps the chain of journals unbroken for SessionRestorer
+            open(journalPath(self.directory, self.generation), "a").close()
+        else:
+            self.journal.close()
+            self.journal = None
+        self.journal_size = 0
+        self.generation += 1
+        self.dirty = False
+        try:
+            os.remove(journalPath(self.directory, self.generation))
+        except FileNotFoundError:
+            pass
+
+        if (
+            self.file_path is not None
+            and not self.document.isModified()
+            and not self.file_path.lower().endswith(".docx")
+            and os.path.exists(self.file_path)
+        ):
+            # The file itself is the snapshot, the journal continues from it
+            reference_path = snapshotPath(self.directory, self.generation, "json")
+            reference = json.dumps(fileReference(self.file_path, self.encoding))
+            replaceAtomic(
+                reference_path, lambda file: file.write(reference), "w", "utf-8"
+            )
+            self.compacted(reference_path, None)
+        elif self.file_path is not None and not isRichFormat(self.file_path):
+            # Saving would drop the formatting too, and toPlainText() is far
+            # cheaper and smaller than toHtml()
+            self.saver.save(
+                self.document,
+                snapshotPath(self.directory, self.generation, "txt"),
+                "utf-8",
+            )
+        else:
+            self.saver.save(
+                self.document, snapshotPath(self.directory, self.generation), "utf-8"
+            )
+
+    def compacted(self, file_path, encoding):
+        generation = int(SNAPSHOT_PATTERN.search(file_path).group(1))
+        if generation <= self.committed_generation:
+            # A slower save that a newer snapshot already superseded
+            try:
+                os.remove(file_path)
+            except OSError:
+                pass
+            return
+        self.committed_generation = generation
+        self.committed.emit(file_path)
+        self.discard(generation)
+
+    def discard(self, generation):
+        for number, name in list(self.generations()):
+            if number < generation:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+    def pause(self):
+        self.write()
+        self.paused = True
+
+    def resume(self, file_path=None, encoding=None):
+        # Whatever happened while paused is not in the journal
+        self.paused = False
+        self.setFile(file_path, encoding)
+        self.compact()
+
+    def restorer(self, snapshot_path):
+        match = SNAPSHOT_PATTERN.search(snapshot_path or "")
+        if match is None or not os.path.exists(snapshot_path):
+            return None
+        return SessionRestorer(self.directory, snapshot_path, self)
+
+    def adopt(self, document, generation, last):
+        self.write()
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+        # Edits to the placeholder document are not part of the restored chain
+        try:
+            os.remove(journalPath(self.directory, self.generation))
+        except FileNotFoundError:
+            pass
+        # Without a layout the document has been accumulating one pending
+        # contentsChange; creating it flushes that before we connect, so it
+        # is not journaled again on the first edit
+        document.documentLayout()
+        self.setDocument(document)
+
+        self.generation = last
+        self.committed_generation = generation
+        if last != generation:
+            self.compact()
+        else:
+            self.discard(generation)
+            if os.path.exists(journalPath(self.directory, generation)):
+                self.journal_size = os.path.getsize(
+                    journalPath(self.directory, generation)
+                )
+
+    def sync(self):
+        # Text edits are journaled but formatting is not, so anything changed
+        # since the last snapshot is compacted before shutdown
+        if self.dirty and not self.paused:
+            self.compact()
+        else:
+            self.write()
+        self.saver.flush()
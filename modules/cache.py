@@ -0,0 +1,126 @@
+import collections
+import hashlib
+import json
+import os
+
+from PySide6.QtCore import *
+
+from modules.document import replaceAtomic
+
+FINGERPRINT_SAMPLE = 1024 * 1024
+
+
+def modelFingerprint(model_path):
+    # Hashing a multi-gigabyte GGUF on every load is too slow; its size,
+    # header and tail tell two model files apart just as well
+    digest = hashlib.sha1(str(os.path.getsize(model_path)).encode("utf-8"))
+    with open(model_path, "rb") as file:
+        digest.update(file.read(FINGERPRINT_SAMPLE))
+        file.seek(max(0, os.path.getsize(model_path) - FINGERPRINT_SAMPLE))
+        digest.update(file.read(FINGERPRINT_SAMPLE))
+    return digest.hexdigest()
+
+
+def normalizeSelection(text):
+    # Collapses the paragraph separators selectedText() returns as well
+    return " ".join(text.split())
+
+
+class ResponseCache(QObject):
+    changed = Signal()
+
+    def __init__(
+        self, file_path=None, capacity=256, max_bytes=4 * 1024 * 1024, parent=None
+    ):
+        super(ResponseCache, self).__init__(parent)
+        self.file_path = file_path
+        self.capacity = capacity
+        self.max_bytes = max_bytes
+        self.entries = collections.OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+        self.save_timer = QTimer(self)
+        self.save_timer.setSingleShot(True)
+        self.save_timer.setInterval(2000)
+        self.save_timer.timeout.connect(self.save)
+
+        if self.file_path is not None:
+            self.load()
+
+    def key(self, model, action, sampling, selection):
+        data = json.dumps(
+            [model, action, sampling, normalizeSelection(selection)], sort_keys=True
+        )
+        return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        response = self.entries.get(key)
+        if response is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        self.changed.emit()
+        return response
+
+    def put(self, key, response):
+        if key in self.entries:
+            self.size -= len(self.entries.pop(key))
+        self.entries[key] = response
+        self.size += len(response)
+        self.evict()
+        self.changed.emit()
+        if self.file_path is not None and not self.save_timer.isActive():
+            self.save_timer.start()
+
+    def evict(self):
+        while self.entries and (
+            len(self.entries) > self.capacity or self.size > self.max_bytes
+        ):
+            _, response = self.entries.popitem(last=False)
+            self.size -= len(response)
+
+    def load(self):
+        try:
+            with open(self.file_path, "r", encoding="utf-8") as file:
+                entries = json.load(file)
+        except (OSError, ValueError):
+            return
+        for key, response in entries:
+            self.entries[key] = response
+            self.size += len(response)
+        self.evict()
+
+    def save(self):
+        self.save_timer.stop()
+        if self.file_path is None:
+            return
+        data = json.dumps(list(self.entries.items()))
+        try:
+            os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+            replaceAtomic(
+                self.file_path,
+                lambda file: file.write(data),
+                mode="w",
+                encoding="utf-8",
+            )
+        except OSError as e:
+            print(f"Response cache not saved: {str(e)}")
+
+    def sync(self):
+        if self.save_timer.isActive():
+            self.save()
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+        self.changed.emit()
+        if self.file_path is not None:
+            self.save()
+
+    def summary(self):
+        lookups = self.hits + self.misses
+        rate = f", {100 * self.hits / lookups:.0f}% hit rate" if lookups else ""
+        return f"Cache: {self.hits} hits, {self.misses} misses{rate}, {len(self.entries)} entries"
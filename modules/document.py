@@ -0,0 +1,652 @@
+import base64
+import codecs
+import hashlib
+import json
+import mimetypes
+import mmap
+import multiprocessing
+import os
+import re
+import stat
+import tempfile
+import time
+from array import array
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import accumulate, chain
+
+from PySide6.QtCore import *
+from PySide6.QtGui import *
+
+from modules.docx import writeDocx
+from modules.lazy import LazyModule
+
+chardet = LazyModule("chardet")
+
+ENCODING_BLOCK_SIZE = 64 * 1024
+
+BOMS = [
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+]
+
+FALLBACK_ENCODING = "cp1252"
+
+
+def decodeSingleByte(error):
+    data = error.object[error.start : error.end]
+    try:
+        return data.decode(FALLBACK_ENCODING), error.end
+    except UnicodeDecodeError:
+        # The few bytes cp1252 leaves undefined
+        return data.decode("latin-1"), error.end
+
+
+codecs.register_error("singlebyte", decodeSingleByte)
+
+
+def detectEncoding(file, byte_limit, block_size=ENCODING_BLOCK_SIZE):
+    blocks = []
+    read = 0
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    detector = None
+
+    while read < byte_limit:
+        block = file.read(min(block_size, byte_limit - read))
+        if not block:
+            break
+        blocks.append(block)
+        read += len(block)
+
+        if len(blocks) == 1:
+            for bom, encoding in BOMS:
+                if block.startswith(bom):
+                    return encoding, block
+
+        if detector is None:
+            try:
+                utf8.decode(block)
+                # A trailing lead byte only counts once its sequence completes
+                if not block.isascii() and utf8.getstate()[0] == b"":
+                    # Multi-byte sequences that decode cleanly are hardly a coincidence
+                    return "utf-8", b"".join(blocks)
+                continue
+            except UnicodeDecodeError:
+                detector = chardet.universaldetector.UniversalDetector()
+                for previous in blocks[:-1]:
+                    detector.feed(previous)
+
+        detector.feed(block)
+        if detector.done:
+            break
+
+    data = b"".join(blocks)
+    if detector is None:
+        try:
+            if read < byte_limit:
+                # The whole file was read, so a pending sequence is truncated
+                utf8.decode(b"", final=True)
+            # Everything within the budget was valid UTF-8 (or plain ASCII)
+            return "utf-8", data
+        except UnicodeDecodeError:
+            detector = chardet.universaldetector.UniversalDetector()
+            for block in blocks:
+                detector.feed(block)
+
+    detector.close()
+    return detector.result["encoding"] or "utf-8", data
+
+
+class FileLoader(QThread):
+    chunk = Signal(str)
+    progress = Signal(int)
+    loaded = Signal(str)
+    failed = Signal(str)
+    fallback = Signal(str)
+
+    def __init__(self, file_path, byte_limit, chunk_size=256 * 1024, parent=None):
+        super(FileLoader, self).__init__(parent)
+        self.file_path = file_path
+        self.byte_limit = byte_limit
+        self.chunk_size = chunk_size
+
+    def decode(self, data, final=False):
+        state = self.decoder.getstate()
+        try:
+            return self.decoder.decode(data, final)
+        except UnicodeDecodeError:
+            # Bytes past the detection budget can still be in another encoding;
+            # replacing them would destroy the original text on the next save
+            self.decoder.setstate(state)
+            self.decoder.errors = "singlebyte"
+            self.fallback.emit(FALLBACK_ENCODING)
+            return self.decoder.decode(data, final)
+
+    def run(self):
+        try:
+            total = max(os.path.getsize(self.file_path), 1)
+            with open(self.file_path, "rb") as file:
+                encoding, data = detectEncoding(file, self.byte_limit)
+                self.decoder = codecs.getincrementaldecoder(encoding)()
+                read = len(data)
+                while data:
+                    if self.isInterruptionRequested():
+                        return
+                    self.chunk.emit(self.decode(data))
+                    self.progress.emit(int(100 * read / total))
+                    data = file.read(self.chunk_size)
+                    read += len(data)
+                self.chunk.emit(self.decode(b"", final=True))
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        self.loaded.emit(encoding)
+
+
+class DocumentLoader(QObject):
+    progress = Signal(int)
+    finished = Signal(str)
+    failed = Signal(str)
+    cancelled = Signal()
+    fallback = Signal(str)
+
+    def __init__(self, document, file_path, mode, byte_limit, parent=None):
+        super(DocumentLoader, self).__init__(parent)
+        self.document = document
+        self.mode = mode
+        self.chunks = deque()
+        self.encoding = None
+        self.loading = False
+
+        self.worker = FileLoader(file_path, byte_limit, parent=self)
+        self.worker.chunk.connect(self.queueChunk)
+        self.worker.progress.connect(self.progress)
+        self.worker.loaded.connect(self.readFinished)
+        self.worker.failed.connect(self.readFailed)
+        self.worker.fallback.connect(self.fallback)
+
+        # Plain text is inserted one chunk per event loop pass to keep typing
+        # and painting responsive while the rest of the file is decoded
+        self.insert_timer = QTimer(self)
+        self.insert_timer.setInterval(0)
+        self.insert_timer.timeout.connect(self.insertChunk)
+
+    def isLoading(self):
+        return self.loading
+
+    def start(self):
+        self.loading = True
+        self.document.setUndoRedoEnabled(False)
+        if self.mode == "plain":
+            self.document.clear()
+        self.worker.start()
+
+    def queueChunk(self, text):
+        if not self.loading:
+            return
+        if text:
+            self.chunks.append(text)
+        if self.mode == "plain" and not self.insert_timer.isActive():
+            self.insert_timer.start()
+
+    def insertChunk(self):
+        if self.chunks:
+            cursor = QTextCursor(self.document)
+            cursor.movePosition(QTextCursor.End)
+            cursor.insertText(self.chunks.popleft())
+        elif self.encoding is not None:
+            self.finish()
+        else:
+            self.insert_timer.stop()
+
+    def readFinished(self, encoding):
+        if not self.loading:
+            return
+        self.encoding = encoding
+        content = "".join(self.chunks) if self.mode != "plain" else None
+        if self.mode == "html":
+            self.chunks.clear()
+            self.document.setHtml(content)
+        elif self.mode == "markdown":
+            self.chunks.clear()
+            self.document.setMarkdown(content)
+
+        if self.chunks:
+            self.insert_timer.start()
+        else:
+            self.finish()
+
+    def readFailed(self, message):
+        self.stop()
+        self.failed.emit(message)
+
+    def finish(self):
+        self.stop()
+        self.document.setModified(False)
+        self.finished.emit(self.encoding)
+
+    def stop(self):
+        self.loading = False
+        self.insert_timer.stop()
+        self.chunks.clear()
+        self.document.setUndoRedoEnabled(True)
+
+    def cancel(self):
+        if not self.loading:
+            return
+        self.worker.requestInterruption()
+        self.worker.wait()
+        self.stop()
+        self.cancelled.emit()
+
+
+class MappedFile:
+    def __init__(self, file_path, encoding, stride=64, line_limit=4096):
+        self.file_path = file_path
+        self.encoding = encoding
+        self.stride = stride
+        self.line_limit = line_limit
+        self.file = open(file_path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.size = len(self.data)
+        # Offset of every stride-th line, so the index stays small for huge files
+        self.index = array("Q", [0])
+        self.line_count = 1
+        self.indexed = False
+
+    def buildIndex(self, interrupted, progress=None, chunk_size=16 * 1024 * 1024):
+        position = 0
+        line = 0
+        while position < self.size:
+            if interrupted():
+                return False
+            end = self.data.find(b"\n", min(position + chunk_size, self.size) - 1)
+            end = self.size if end < 0 else end + 1
+            lines = self.data[position:end].split(b"\n")
+            if end < self.size or lines[-1] == b"":
+                lines.pop()
+
+            starts = accumulate(chain((0,), (length + 1 for length in map(len, lines))))
+            starts = list(starts)[: len(lines)]
+            for start in starts[(-line) % self.stride :: self.stride]:
+                if position + start:
+                    self.index.append(position + start)
+
+            line += len(lines)
+            self.line_count = max(line, 1)
+            position = end
+            if progress is not None:
+                progress(int(100 * position / self.size))
+        self.indexed = True
+        return True
+
+    def lineOffset(self, number):
+        number = min(number, self.line_count - 1)
+        offset = self.index[number // self.stride]
+        for _ in range(number % self.stride):
+            offset = self.data.find(b"\n", offset) + 1
+        return offset
+
+    def lineAt(self, offset):
+        slot = bisect_right(self.index, offset) - 1
+        return slot * self.stride + self.data[self.index[slot] : offset].count(b"\n")
+
+    def lines(self, first, count):
+        offset = self.lineOffset(first)
+        lines = []
+        for _ in range(min(count, self.line_count - first)):
+            end = self.data.find(b"\n", offset)
+            if end < 0:
+                end = self.size
+            data = self.data[offset : min(end, offset + self.line_limit)]
+            lines.append(data.decode(self.encoding, errors="replace").rstrip("\r"))
+            offset = end + 1
+        return lines
+
+    def find(self, text, offset=0):
+        return self.data.find(text.encode(self.encoding, errors="replace"), offset)
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+
+class MappedFileIndexer(QThread):
+    progress = Signal(int)
+
+    def __init__(self, mapped_file, parent=None):
+        super(MappedFileIndexer, self).__init__(parent)
+        self.mapped_file = mapped_file
+
+    def run(self):
+        self.mapped_file.buildIndex(self.isInterruptionRequested, self.progress.emit)
+
+
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+CACHE_MAX_AGE = 30 * 24 * 60 * 60
+
+docx_executor = None
+
+
+def docxExecutor():
+    global docx_executor
+    if docx_executor is None:
+        # Forking a process that already runs Qt and worker threads can
+        # deadlock the child on a lock some other thread held
+        docx_executor = ProcessPoolExecutor(
+            max_workers=1, mp_context=multiprocessing.get_context("spawn")
+        )
+    return docx_executor
+
+
+def cacheDirectory(name):
+    return os.path.join(
+        QStandardPaths.writableLocation(QStandardPaths.CacheLocation), name
+    )
+
+
+def docxCachePath(file_path):
+    stat = os.stat(file_path)
+    key = f"{os.path.abspath(file_path)}\0{stat.st_mtime_ns}\0{stat.st_size}"
+    return os.path.join(
+        cacheDirectory("docx"), hashlib.sha1(key.encode("utf-8")).hexdigest() + ".json"
+    )
+
+
+def touch(paths):
+    # Cache entries age by modification time, so every use renews them
+    for path in paths:
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+
+def pruneCache(directories, max_bytes=CACHE_MAX_BYTES, max_age=CACHE_MAX_AGE):
+    files = []
+    for directory in directories:
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        info = entry.stat()
+                        files.append((info.st_mtime, info.st_size, entry.path))
+        except OSError:
+            continue
+
+    # A DOCX entry whose resources are gone is simply converted again
+    files.sort()
+    total = sum(size for _, size, _ in files)
+    expired = time.time() - max_age
+    for modified, size, path in files:
+        if modified >= expired and total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+
+def scheduleCachePruning():
+    directories = [cacheDirectory("docx"), cacheDirectory("resources")]
+    QThreadPool.globalInstance().start(lambda: pruneCache(directories))
+
+
+def writeAtomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "wb") as file:
+        file.write(data)
+    os.replace(path + ".tmp", path)
+
+
+def storeResource(resource_directory, data, content_type):
+    # Content-addressed, so identical images across documents are stored once
+    extension = mimetypes.guess_extension(content_type or "") or ".bin"
+    path = os.path.join(resource_directory, hashlib.sha1(data).hexdigest() + extension)
+    if os.path.exists(path):
+        touch([path])
+    else:
+        writeAtomic(path, data)
+    return path
+
+
+def convertDocx(file_path, cache_path, resource_directory):
+    import mammoth
+
+    resources = []
+
+    def convertImage(image):
+        with image.open() as stream:
+            path = storeResource(resource_directory, stream.read(), image.content_type)
+        resources.append(path)
+        return {"src": QUrl.fromLocalFile(path).toString()}
+
+    with open(file_path, "rb") as file:
+        result = mammoth.convert_to_html(
+            file, convert_image=mammoth.images.img_element(convertImage)
+        )
+    messages = [f"{message.type}: {message.message}" for message in result.messages]
+    converted = {"html": result.value, "messages": messages, "resources": resources}
+
+    try:
+        writeAtomic(cache_path, json.dumps(converted).encode("utf-8"))
+    except OSError:
+        pass
+    return converted
+
+
+def inlineResources(html):
+    # Resource images live in the local cache; saved HTML must stay portable
+    resource_url = QUrl.fromLocalFile(cacheDirectory("resources")).toString()
+
+    def inline(match):
+        path = QUrl(match.group(1)).toLocalFile()
+        try:
+            with open(path, "rb") as file:
+                data = base64.b64encode(file.read()).decode("utf-8")
+        except OSError:
+            return match.group(0)
+        mime_type = mimetypes.guess_type(path)[0] or "image/png"
+        return f'src="data:{mime_type};base64,{data}"'
+
+    return re.sub(rf'src="({re.escape(resource_url)}/[^"]+)"', inline, html)
+
+
+class DocxLoader(QObject):
+    progress = Signal(int)
+    finished = Signal(object)
+    failed = Signal(str)
+    cancelled = Signal()
+    report = Signal(str)
+    converted = Signal(object)
+
+    def __init__(self, document, file_path, parent=None):
+        super(DocxLoader, self).__init__(parent)
+        self.document = document
+        self.file_path = file_path
+        self.future = None
+        self.loading = False
+        self.started = 0
+        self.converted.connect(self.conversionDone)
+
+    def isLoading(self):
+        return self.loading
+
+    def start(self):
+        self.loading = True
+        self.started = time.perf_counter()
+        cache_path = docxCachePath(self.file_path)
+
+        try:
+            with open(cache_path, "r", encoding="utf-8") as file:
+                cached = json.load(file)
+            if all(os.path.exists(path) for path in cached["resources"]):
+                touch([cache_path] + cached["resources"])
+                QTimer.singleShot(0, lambda: self.apply(cached, True))
+                return
+        except (OSError, ValueError, KeyError):
+            pass
+
+        self.future = docxExecutor().submit(
+            convertDocx, self.file_path, cache_path, cacheDirectory("resources")
+        )
+        # The callback runs on an executor thread; the signal hops back to ours
+        self.future.add_done_callback(self.converted.emit)
+
+    def conversionDone(self, future):
+        if not self.loading or future.cancelled():
+            return
+        try:
+            converted = future.result()
+        except Exception as e:
+            self.loading = False
+            self.failed.emit(str(e))
+            return
+        self.apply(converted, False)
+
+    def apply(self, converted, cached):
+        if not self.loading:
+            return
+        for path in set(converted["resources"]):
+            self.document.addResource(
+                QTextDocument.ImageResource, QUrl.fromLocalFile(path), QImage(path)
+            )
+        self.document.setHtml(converted["html"])
+        self.loading = False
+
+        messages = converted["messages"]
+        elapsed = time.perf_counter() - self.started
+        summary = f"DOCX{' (cache)' if cached else ''}: {elapsed:.2f} s"
+        if messages:
+            summary += f", {len(messages)} warning(s): {messages[0]}"
+        self.report.emit(summary)
+        self.finished.emit(None)
+
+    def cancel(self):
+        if not self.loading:
+            return
+        self.loading = False
+        if self.future is not None:
+            self.future.cancel()
+        self.cancelled.emit()
+
+
+def replaceAtomic(file_path, write, mode="wb", encoding=None):
+    # Written next to the target so the final rename stays on one filesystem
+    descriptor, temporary = tempfile.mkstemp(
+        prefix=".", suffix=".tmp", dir=os.path.dirname(os.path.abspath(file_path))
+    )
+    try:
+        with open(descriptor, mode, encoding=encoding) as file:
+            write(file)
+            file.flush()
+            os.fsync(file.fileno())
+        try:
+            os.chmod(temporary, stat.S_IMODE(os.stat(file_path).st_mode))
+        except FileNotFoundError:
+            os.chmod(temporary, 0o644)
+        os.replace(temporary, file_path)
+    except BaseException:
+        try:
+            os.unlink(temporary)
+        except OSError:
+            pass
+        raise
+
+
+def isRichFormat(file_path):
+    return file_path.lower().endswith((".swdoc", ".html", ".htm", ".md", ".docx"))
+
+
+class SaveWorker(QThread):
+    saved = Signal(str, str)
+    failed = Signal(str)
+
+    def __init__(self, snapshot, file_path, encoding, parent=None):
+        super(SaveWorker, self).__init__(parent)
+        self.snapshot = snapshot
+        self.file_path = file_path
+        self.encoding = encoding
+
+    def run(self):
+        try:
+            self.write()
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        self.saved.emit(self.file_path, self.encoding)
+
+    def write(self):
+        file_path = self.file_path.lower()
+        if file_path.endswith(".docx"):
+            replaceAtomic(self.file_path, lambda file: writeDocx(self.snapshot, file))
+            return
+        if file_path.endswith(".md"):
+            content = self.snapshot.toMarkdown()
+        elif file_path.endswith((".swdoc", ".html", ".htm")):
+            content = inlineResources(self.snapshot)
+        else:
+            content = self.snapshot
+
+        replaceAtomic(
+            self.file_path, lambda file: file.write(content), "w", self.encoding
+        )
+
+
+class DocumentSaver(QObject):
+    saved = Signal(str, str)
+    failed = Signal(str)
+
+    def __init__(self, parent=None):
+        super(DocumentSaver, self).__init__(parent)
+        self.worker = None
+        self.pending = None
+
+    def isSaving(self):
+        return self.worker is not None or self.pending is not None
+
+    def save(self, document, file_path, encoding):
+        # The writers walk a detached clone, so .docx and .md never go through
+        # an HTML string; HTML output needs that string anyway
+        if file_path.lower().endswith((".docx", ".md")):
+            snapshot = document.clone()
+        elif isRichFormat(file_path):
+            snapshot = document.toHtml()
+        else:
+            snapshot = document.toPlainText()
+
+        # Write-behind: only the newest snapshot waits behind a running save
+        self.pending = (snapshot, file_path, encoding)
+        if self.worker is None:
+            self.next()
+
+    def next(self):
+        if self.pending is None:
+            return
+        self.worker = SaveWorker(*self.pending, parent=self)
+        self.pending = None
+        self.worker.saved.connect(self.saved)
+        self.worker.failed.connect(self.failed)
+        self.worker.finished.connect(self.workerFinished)
+        self.worker.start()
+
+    def workerFinished(self):
+        # flush() may already have retired the worker this signal came from
+        if self.worker is None or not self.worker.isFinished():
+            return
+        self.worker.deleteLater()
+        self.worker = None
+        self.next()
+
+    def flush(self):
+        while self.worker is not None:
+            self.worker.wait()
+            # Delivers saved/failed now; at shutdown the event loop never would
+            QCoreApplication.sendPostedEvents(self, QEvent.MetaCall)
+            self.workerFinished()
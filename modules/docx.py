@@ -0,0 +1,233 @@
+import shutil
+import tempfile
+import zipfile
+from xml.sax.saxutils import escape, quoteattr
+
+from PySide6.QtCore import *
+from PySide6.QtGui import *
+
+EMU_PER_PIXEL = 9525
+
+CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Default Extension="png" ContentType="image/png"/>'
+    '<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '<Override PartName="/word/numbering.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.numbering+xml"/>'
+    "</Types>"
+)
+
+PACKAGE_RELATIONSHIPS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>'
+    "</Relationships>"
+)
+
+# numId 1 is a bullet list, numId 2 a decimal list
+NUMBERING = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<w:numbering xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+    '<w:abstractNum w:abstractNumId="0"><w:lvl w:ilvl="0"><w:start w:val="1"/>'
+    '<w:numFmt w:val="bullet"/><w:lvlText w:val="•"/><w:lvlJc w:val="left"/>'
+    '<w:pPr><w:ind w:left="720" w:hanging="360"/></w:pPr></w:lvl></w:abstractNum>'
+    '<w:abstractNum w:abstractNumId="1"><w:lvl w:ilvl="0"><w:start w:val="1"/>'
+    '<w:numFmt w:val="decimal"/><w:lvlText w:val="%1."/><w:lvlJc w:val="left"/>'
+    '<w:pPr><w:ind w:left="720" w:hanging="360"/></w:pPr></w:lvl></w:abstractNum>'
+    '<w:num w:numId="1"><w:abstractNumId w:val="0"/></w:num>'
+    '<w:num w:numId="2"><w:abstractNumId w:val="1"/></w:num>'
+    "</w:numbering>"
+)
+
+DOCUMENT_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+    ' xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"'
+    ' xmlns:wp="http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing"'
+    ' xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main"'
+    ' xmlns:pic="http://schemas.openxmlformats.org/drawingml/2006/picture">'
+    "<w:body>"
+)
+
+DOCUMENT_END = "<w:sectPr/></w:body></w:document>"
+
+ALIGNMENTS = [
+    (Qt.AlignHCenter, "center"),
+    (Qt.AlignRight, "right"),
+    (Qt.AlignJustify, "both"),
+]
+
+NUMBERED_STYLES = (
+    QTextListFormat.ListDecimal,
+    QTextListFormat.ListLowerAlpha,
+    QTextListFormat.ListUpperAlpha,
+    QTextListFormat.ListLowerRoman,
+    QTextListFormat.ListUpperRoman,
+)
+
+
+class DocxWriter:
+    def __init__(self, document, file):
+        self.document = document
+        self.file = file
+        self.images = {}
+        # Run properties only depend on the format, which documents share
+        # between many fragments
+        self.run_properties = {}
+
+    def write(self):
+        with zipfile.ZipFile(self.file, "w", zipfile.ZIP_DEFLATED) as package:
+            self.package = package
+            package.writestr("[Content_Types].xml", CONTENT_TYPES)
+            package.writestr("_rels/.rels", PACKAGE_RELATIONSHIPS)
+            package.writestr("word/numbering.xml", NUMBERING)
+
+            # document.xml is spooled to disk one paragraph at a time while
+            # images go straight into word/media, since a zip archive only
+            # accepts one open member at a time
+            with tempfile.TemporaryFile() as body:
+                body.write(DOCUMENT_START.encode("utf-8"))
+                block = self.document.begin()
+                while block.isValid():
+                    body.write(self.paragraph(block).encode("utf-8"))
+                    block = block.next()
+                body.write(DOCUMENT_END.encode("utf-8"))
+
+                body.seek(0)
+                with package.open("word/document.xml", "w") as stream:
+                    shutil.copyfileobj(body, stream)
+
+            package.writestr("word/_rels/document.xml.rels", self.relationships())
+
+    def paragraph(self, block):
+        properties = ""
+        alignment = block.blockFormat().alignment()
+        for flag, value in ALIGNMENTS:
+            if alignment & flag:
+                properties += f'<w:jc w:val="{value}"/>'
+                break
+
+        text_list = block.textList()
+        if text_list is not None:
+            numbered = text_list.format().style() in NUMBERED_STYLES
+            properties = (
+                f'<w:numPr><w:ilvl w:val="0"/><w:numId w:val="{2 if numbered else 1}"/></w:numPr>'
+                + properties
+            )
+
+        runs = []
+        for iterator in block:
+            fragment = iterator.fragment()
+            if fragment.isValid():
+                runs.append(self.run(fragment))
+
+        pPr = f"<w:pPr>{properties}</w:pPr>" if properties else ""
+        return f"<w:p>{pPr}{''.join(runs)}</w:p>"
+
+    def run(self, fragment):
+        char_format = fragment.charFormat()
+        if char_format.isImageFormat():
+            return self.image(char_format.toImageFormat())
+
+        index = fragment.charFormatIndex()
+        if index not in self.run_properties:
+            self.run_properties[index] = self.runProperties(char_format)
+        rPr = self.run_properties[index]
+
+        content = []
+        for i, line in enumerate(fragment.text().split("\u2028")):
+            if i:
+                content.append("<w:br/>")
+            for j, part in enumerate(line.split("\t")):
+                if j:
+                    content.append("<w:tab/>")
+                if part:
+                    content.append(f'<w:t xml:space="preserve">{escape(part)}</w:t>')
+
+        return f"<w:r>{rPr}{''.join(content)}</w:r>"
+
+    def runProperties(self, char_format):
+        properties = ""
+        families = char_format.fontFamilies()
+        if families:
+            family = quoteattr(families[0])
+            properties += f"<w:rFonts w:ascii={family} w:hAnsi={family} w:cs={family}/>"
+        if char_format.fontWeight() >= QFont.Bold:
+            properties += "<w:b/>"
+        if char_format.fontItalic():
+            properties += "<w:i/>"
+        if char_format.fontUnderline():
+            properties += '<w:u w:val="single"/>'
+        if char_format.foreground().style() != Qt.NoBrush:
+            color = char_format.foreground().color().name()[1:]
+            properties += f'<w:color w:val="{color}"/>'
+        if char_format.background().style() != Qt.NoBrush:
+            color = char_format.background().color().name()[1:]
+            properties += f'<w:shd w:val="clear" w:color="auto" w:fill="{color}"/>'
+        if char_format.fontPointSize() > 0:
+            properties += f'<w:sz w:val="{round(char_format.fontPointSize() * 2)}"/>'
+        return f"<w:rPr>{properties}</w:rPr>" if properties else ""
+
+    def image(self, image_format):
+        name = image_format.name()
+        if name not in self.images:
+            resource = self.document.resource(QTextDocument.ImageResource, QUrl(name))
+            if isinstance(resource, QPixmap):
+                resource = resource.toImage()
+            elif isinstance(resource, (QByteArray, bytes)):
+                resource = QImage.fromData(resource)
+            if not isinstance(resource, QImage) or resource.isNull():
+                return ""
+
+            data = QByteArray()
+            buffer = QBuffer(data)
+            buffer.open(QIODevice.WriteOnly)
+            resource.save(buffer, "PNG")
+            number = len(self.images) + 1
+            self.package.writestr(f"word/media/image{number}.png", data.data())
+            self.images[name] = (number, resource.width(), resource.height())
+
+        number, width, height = self.images[name]
+        if image_format.width() > 0 and image_format.height() > 0:
+            width, height = image_format.width(), image_format.height()
+        elif image_format.width() > 0:
+            width, height = image_format.width(), height * image_format.width() / width
+        elif image_format.height() > 0:
+            width, height = (
+                width * image_format.height() / height,
+                image_format.height(),
+            )
+        cx = int(width * EMU_PER_PIXEL)
+        cy = int(height * EMU_PER_PIXEL)
+
+        return (
+            f'<w:r><w:drawing><wp:inline><wp:extent cx="{cx}" cy="{cy}"/>'
+            f'<wp:docPr id="{number}" name="image{number}"/>'
+            '<a:graphic><a:graphicData uri="http://schemas.openxmlformats.org/drawingml/2006/picture">'
+            f'<pic:pic><pic:nvPicPr><pic:cNvPr id="{number}" name="image{number}.png"/><pic:cNvPicPr/></pic:nvPicPr>'
+            f'<pic:blipFill><a:blip r:embed="rIdImage{number}"/><a:stretch><a:fillRect/></a:stretch></pic:blipFill>'
+            f'<pic:spPr><a:xfrm><a:off x="0" y="0"/><a:ext cx="{cx}" cy="{cy}"/></a:xfrm>'
+            '<a:prstGeom prst="rect"><a:avLst/></a:prstGeom></pic:spPr></pic:pic>'
+            "</a:graphicData></a:graphic></wp:inline></w:drawing></w:r>"
+        )
+
+    def relationships(self):
+        relationships = [
+            '<Relationship Id="rIdNumbering" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/numbering" Target="numbering.xml"/>'
+        ]
+        for number, _, _ in self.images.values():
+            relationships.append(
+                f'<Relationship Id="rIdImage{number}" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/image" Target="media/image{number}.png"/>'
+            )
+        return (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            + "".join(relationships)
+            + "</Relationships>"
+        )
+
+
+def writeDocx(document, file):
+    DocxWriter(document, file).write()
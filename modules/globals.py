@@ -19,8 +19,11 @@ fallbackValues = {
     "appTheme": "light",
     "appLanguage": "1252",
     "adaptiveResponse": 1,
+    "encodingByteLimit": 1024 * 1024,
+    "saveEncoding": None,
+    "largeFileThreshold": 64 * 1024 * 1024,
     "readFilter": "General File (*.swdoc *.docx);;HTML (*.html);;Text (*.txt);;Key-Value (*.ini);;LOG (*.log);;JavaScript Object Notation (*.json);;Extensible Markup Language (*.xml);;Javascript (*.js);;Cascading Style Sheets (*.css);;Structured Query Language (*.sql);;Markdown (*.md)",
-    "writeFilter": "SolidWriting Document (*.swdoc);;HTML (*.html);;Text (*.txt);;Key-Value (*.ini);;LOG (*.log);;JavaScript Object Notation (*.json);;Extensible Markup Language (*.xml);;Javascript (*.js);;Cascading Style Sheets (*.css);;Structured Query Language (*.sql);;Markdown (*.md)",
+    "writeFilter": "SolidWriting Document (*.swdoc);;Word Document (*.docx);;HTML (*.html);;Text (*.txt);;Key-Value (*.ini);;LOG (*.log);;JavaScript Object Notation (*.json);;Extensible Markup Language (*.xml);;Javascript (*.js);;Cascading Style Sheets (*.css);;Structured Query Language (*.sql);;Markdown (*.md)",
     "mediaFilter": "General (*.png *.jpg *.jpeg *.bmp);;Animation (*.gif)",
 }
 
@@ -0,0 +1,96 @@
+import ctypes.util
+import hashlib
+import importlib.metadata
+import os
+import platform
+import sys
+
+from PySide6.QtCore import *
+
+from modules.lazy import LazyModule
+
+llama_cpp = LazyModule("llama_cpp")
+
+# Backend names as they appear in llama_print_system_info()
+LLAMA_BACKENDS = [
+    ("CUDA", "cuda"),
+    ("ROCm", "rocm"),
+    ("Vulkan", "vulkan"),
+    ("Metal", "metal"),
+]
+
+WINDOWS_DRIVERS = ["nvcuda.dll", "amdhip64.dll", "vulkan-1.dll"]
+
+
+def llamaVersion():
+    try:
+        return importlib.metadata.version("llama_cpp_python")
+    except importlib.metadata.PackageNotFoundError:
+        return ""
+
+
+def hardwareFingerprint():
+    # Cheap enough for every start, but changes with the OS, llama.cpp or
+    # an installed GPU driver
+    parts = [platform.platform(), platform.machine(), llamaVersion()]
+    try:
+        with open("/proc/driver/nvidia/version", "r") as file:
+            parts.append(file.readline())
+    except OSError:
+        pass
+    system_directory = os.path.join(os.environ.get("SystemRoot", ""), "System32")
+    for name in WINDOWS_DRIVERS:
+        path = os.path.join(system_directory, name)
+        if os.path.exists(path):
+            parts.append(f"{name}:{os.stat(path).st_mtime_ns}")
+    return hashlib.sha1("\0".join(parts).encode("utf-8")).hexdigest()
+
+
+def llamaBackend():
+    try:
+        if not llama_cpp.llama_supports_gpu_offload():
+            return "cpu"
+        info = llama_cpp.llama_print_system_info().decode("utf-8", "replace")
+    except (ImportError, OSError, AttributeError, RuntimeError):
+        # A broken install raises RuntimeError for its missing shared library
+        return None
+    for name, backend in LLAMA_BACKENDS:
+        if f"{name} :" in info:
+            return backend
+    return systemBackend() or "gpu"
+
+
+def systemBackend():
+    if sys.platform == "darwin":
+        return "metal" if platform.machine() == "arm64" else None
+    if os.path.exists("/proc/driver/nvidia/version") or ctypes.util.find_library(
+        "nvcuda"
+    ):
+        return "cuda"
+    if os.path.exists("/dev/kfd") or ctypes.util.find_library("amdhip64"):
+        return "rocm"
+    if ctypes.util.find_library("vulkan") or ctypes.util.find_library("vulkan-1"):
+        return "vulkan"
+    return None
+
+
+def acceleratorBackend():
+    # llama.cpp knows what it was built with; without it, fall back to
+    # looking for GPU drivers
+    return llamaBackend() or systemBackend() or "cpu"
+
+
+class HardwareProbe(QThread):
+    detected = Signal(str, str)
+
+    def __init__(self, fingerprint=None, backend=None, parent=None):
+        super(HardwareProbe, self).__init__(parent)
+        self.fingerprint = fingerprint
+        self.backend = backend
+
+    def run(self):
+        fingerprint = hardwareFingerprint()
+        if fingerprint == self.fingerprint and self.backend:
+            self.detected.emit(self.backend, fingerprint)
+        else:
+            self.detected.emit(acceleratorBackend(), fingerprint)
@@ -0,0 +1,254 @@
+import threading
+from collections import Counter, OrderedDict
+
+from PySide6.QtCore import *
+from PySide6.QtGui import *
+
+from modules.lazy import LazyModule
+
+langdetect = LazyModule("langdetect")
+
+profiles_lock = threading.Lock()
+
+
+def loadProfiles():
+    # langdetect loads its profiles lazily into one global factory, which is
+    # not safe to do from several threads at once
+    with profiles_lock:
+        langdetect.DetectorFactory.seed = 0
+        langdetect.detector_factory.init_factory()
+    return langdetect.detector_factory._factory
+
+
+def warmProfiles():
+    QThreadPool.globalInstance().start(loadProfiles)
+
+
+def detectText(text):
+    return detectMany([text])[0]
+
+
+def detectMany(texts):
+    factory = loadProfiles()
+    languages = []
+    for text in texts:
+        try:
+            detector = factory.create()
+            detector.append(text)
+            languages.append(detector.detect())
+        except Exception:
+            languages.append(None)
+    return languages
+
+
+class LanguageDetector:
+    def __init__(
+        self, sample_size=4096, paragraph_size=512, change_ratio=0.05, cache_size=4096
+    ):
+        self.sample_size = sample_size
+        self.paragraph_size = paragraph_size
+        self.change_ratio = change_ratio
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.language = None
+        self.changed = 0
+
+    def invalidate(self, changed):
+        self.changed += changed
+
+    def sample(self, texts):
+        count = len(texts)
+        picks = min(count, self.sample_size // self.paragraph_size)
+        samples = []
+        for i in range(picks):
+            text = texts[i * count // picks].strip()
+            if text:
+                samples.append(text[: self.paragraph_size])
+        return samples
+
+    def remember(self, key, language):
+        self.cache[key] = language
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def detectDocument(self, texts, character_count):
+        # Skip detection until enough text changed to plausibly flip the answer
+        threshold = max(self.paragraph_size, character_count * self.change_ratio)
+        if self.language is not None and self.changed < threshold:
+            return self.language
+
+        samples = self.sample(texts)
+        missing = [text for text in samples if hash(text) not in self.cache]
+        for text, language in zip(missing, detectMany(missing)):
+            self.remember(hash(text), language)
+
+        votes = Counter()
+        for text in samples:
+            key = hash(text)
+            self.cache.move_to_end(key)
+            if self.cache[key]:
+                votes[self.cache[key]] += len(text)
+
+        self.language = votes.most_common(1)[0][0] if votes else None
+        self.changed = 0
+        return self.language
+
+
+def languageSummary(tally, limit=3):
+    total = sum(tally.values())
+    if not total:
+        return None
+    return ", ".join(
+        f"{language} {round(100 * count / total)}%"
+        for language, count in tally.most_common(limit)
+        if 100 * count >= total
+    )
+
+
+class LanguageBlockData(QTextBlockUserData):
+    def __init__(self, revision, language):
+        super(LanguageBlockData, self).__init__()
+        self.revision = revision
+        self.language = language
+
+
+class LanguageIndexSignals(QObject):
+    result = Signal(object, object)
+
+
+class LanguageIndexTask(QRunnable):
+    def __init__(self, batch, paragraph_size):
+        super(LanguageIndexTask, self).__init__()
+        self.batch = batch
+        self.paragraph_size = paragraph_size
+        self.signals = LanguageIndexSignals()
+
+    def run(self):
+        samples = [text.strip()[: self.paragraph_size] for _, _, text in self.batch]
+        languages = detectMany([sample for sample in samples if len(sample) >= 20])
+        languages.reverse()
+
+        results = []
+        for (number, revision, text), sample in zip(self.batch, samples):
+            language = languages.pop() if len(sample) >= 20 else None
+            results.append((number, revision, hash(text), language))
+        self.signals.result.emit(self, results)
+
+
+class LanguageIndexer(QObject):
+    distributionChanged = Signal(object)
+
+    def __init__(
+        self,
+        document,
+        adaptiveResponse=1,
+        scan_size=512,
+        batch_size=64,
+        paragraph_size=512,
+        parent=None,
+    ):
+        super(LanguageIndexer, self).__init__(parent)
+        self.document = document
+        self.scan_size = scan_size
+        self.batch_size = batch_size
+        self.paragraph_size = paragraph_size
+
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max(1, QThread.idealThreadCount() // 2))
+        self.tasks = set()
+        self.pending = set()
+
+        self.position = 0
+        self.clean = True
+        self.tally = Counter()
+        self.summary = None
+
+        # Indexing only runs once typing has paused
+        self.idle_timer = QTimer(self)
+        self.idle_timer.setSingleShot(True)
+        self.idle_timer.timeout.connect(self.step)
+        self.setAdaptiveResponse(adaptiveResponse)
+
+        self.document.contentsChange.connect(self.schedule)
+        self.schedule()
+
+    def setDocument(self, document):
+        self.document.contentsChange.disconnect(self.schedule)
+        self.document = document
+        self.document.contentsChange.connect(self.schedule)
+        self.position = 0
+        self.pending = set()
+        self.schedule()
+
+    def setAdaptiveResponse(self, adaptiveResponse):
+        self.idle_timer.setInterval(int(500 * float(adaptiveResponse)))
+
+    def schedule(self, *args):
+        self.idle_timer.start()
+
+    def step(self):
+        if self.idle_timer.isActive():
+            return
+
+        while len(self.tasks) < self.pool.maxThreadCount():
+            batch = self.scan()
+            if batch:
+                task = LanguageIndexTask(batch, self.paragraph_size)
+                task.signals.result.connect(self.collect)
+                self.tasks.add(task)
+                self.pool.start(task)
+            elif self.position != 0:
+                # Yield to the event loop between scan chunks
+                QTimer.singleShot(0, self.step)
+                return
+            elif self.tasks:
+                return
+            elif self.clean:
+                self.publish()
+                return
+
+    def scan(self):
+        if self.position == 0:
+            self.tally = Counter()
+            self.clean = True
+        block = self.document.findBlockByNumber(self.position)
+        batch = []
+        for _ in range(self.scan_size):
+            if not block.isValid():
+                self.position = 0
+                return batch
+
+            data = block.userData()
+            key = (block.blockNumber(), block.revision())
+            if isinstance(data, LanguageBlockData) and data.revision == key[1]:
+                if data.language:
+                    self.tally[data.language] += block.length()
+            else:
+                self.clean = False
+                if key not in self.pending:
+                    self.pending.add(key)
+                    batch.append((key[0], key[1], block.text()))
+
+            block = block.next()
+            if len(batch) >= self.batch_size:
+                break
+
+        self.position = block.blockNumber() if block.isValid() else 0
+        return batch
+
+    def collect(self, task, results):
+        self.tasks.discard(task)
+        for number, revision, text_hash, language in results:
+            self.pending.discard((number, revision))
+            block = self.document.findBlockByNumber(number)
+            # The block may have been edited or moved while the batch ran
+            if block.revision() != revision or hash(block.text()) != text_hash:
+                continue
+            block.setUserData(LanguageBlockData(revision, language))
+        self.step()
+
+    def publish(self):
+        summary = languageSummary(self.tally)
+        if summary != self.summary:
+            self.summary = summary
+            self.distributionChanged.emit(summary)
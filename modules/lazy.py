@@ -0,0 +1,24 @@
+import importlib
+import sys
+import threading
+
+
+class LazyModule:
+    def __init__(self, name):
+        self.name = name
+        self.module = None
+        self.lock = threading.Lock()
+
+    def load(self):
+        if self.module is None:
+            with self.lock:
+                if self.module is None:
+                    self.module = importlib.import_module(self.name)
+        return self.module
+
+    def isLoaded(self):
+        return self.module is not None or self.name in sys.modules
+
+    def __getattr__(self, attribute):
+        # Only reached for names the facade itself does not define
+        return getattr(self.load(), attribute)
@@ -0,0 +1,240 @@
+import heapq
+import itertools
+
+from PySide6.QtCore import *
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+# Short edits on a selection jump ahead of long-form requests
+ACTION_PRIORITIES = {
+    "typo": PRIORITY_HIGH,
+    "fix": PRIORITY_HIGH,
+    "clarify": PRIORITY_HIGH,
+    "ask": PRIORITY_NORMAL,
+    "summary": PRIORITY_LOW,
+    "suggestions": PRIORITY_LOW,
+}
+
+# Upper bound on generated tokens, so a runaway answer cannot hold the
+# model for minutes; typo and fix echo the selection back, so they get more
+ACTION_MAX_TOKENS = {
+    "typo": 512,
+    "fix": 512,
+    "clarify": 256,
+    "ask": 512,
+    "summary": 192,
+    "suggestions": 384,
+}
+
+
+# llama.cpp's own defaults, spelled out because cached responses are only
+# valid for the parameters they were sampled with
+SAMPLING_PARAMS = {
+    "temperature": 0.2,
+    "top_p": 0.95,
+    "top_k": 40,
+    "min_p": 0.05,
+    "repeat_penalty": 1.0,
+}
+
+# Room left for the chat template around each message
+MESSAGE_OVERHEAD = 8
+
+
+class ChatSession:
+    def __init__(self):
+        self.history = []
+        self.tokens = []
+        # Model state after the last turn, saved only once another request
+        # is about to overwrite the KV cache
+        self.state = None
+
+    def messages(self, llm, prompt, max_tokens=None):
+        # Oldest turns go first when the history outgrows the context, which
+        # costs one full prompt evaluation
+        budget = llm.n_ctx() - (max_tokens or llm.n_ctx() // 4)
+        budget -= self.count(llm, prompt)
+        while self.history and sum(self.tokens) > budget:
+            del self.history[:2]
+            del self.tokens[:2]
+        return self.history + [{"role": "user", "content": prompt}]
+
+    def count(self, llm, text):
+        return len(llm.tokenize(text.encode("utf-8"), add_bos=False)) + MESSAGE_OVERHEAD
+
+    def append(self, llm, prompt, response):
+        self.history.append({"role": "user", "content": prompt})
+        self.history.append({"role": "assistant", "content": response})
+        self.tokens.append(self.count(llm, prompt))
+        self.tokens.append(self.count(llm, response))
+
+
+class LLMRequest:
+    def __init__(self, request_id, prompt, priority, max_tokens=None, session=None):
+        self.request_id = request_id
+        self.prompt = prompt
+        self.priority = priority
+        self.max_tokens = max_tokens
+        self.session = session
+        self.cancelled = False
+
+
+class LLMWorker(QThread):
+    chunk = Signal(int, str)
+    result = Signal(int, str)
+    requestStarted = Signal(int)
+    requestCancelled = Signal(int)
+    queueChanged = Signal(int)
+
+    def __init__(self, queue_limit=4, parent=None):
+        super(LLMWorker, self).__init__(parent)
+        self.llm = None
+        self.queue_limit = queue_limit
+        self.queue = []
+        self.current = None
+        # The session whose conversation is in the model's KV cache
+        self.owner = None
+        self.request_ids = itertools.count(1)
+        self.stopping = False
+        self.mutex = QMutex()
+        self.condition = QWaitCondition()
+        QCoreApplication.instance().aboutToQuit.connect(self.stop)
+
+    def setModel(self, llm):
+        # Llama is not thread-safe, so this thread is the only one calling it
+        self.mutex.lock()
+        self.llm = llm
+        self.owner = None
+        self.mutex.unlock()
+        if not self.isRunning():
+            self.start()
+
+    def submit(self, prompt, priority=PRIORITY_NORMAL, max_tokens=None, session=None):
+        self.mutex.lock()
+        if len(self.queue) >= self.queue_limit:
+            self.mutex.unlock()
+            return None
+        request = LLMRequest(
+            next(self.request_ids), prompt, priority, max_tokens, session
+        )
+        # The id breaks ties, so equal priorities stay first in, first out
+        heapq.heappush(self.queue, (priority, request.request_id, request))
+        waiting = len(self.queue)
+        self.condition.wakeOne()
+        self.mutex.unlock()
+
+        self.queueChanged.emit(waiting)
+        return request.request_id
+
+    def cancel(self, request_id):
+        self.mutex.lock()
+        if self.current is not None and self.current.request_id == request_id:
+            # Checked between streamed tokens, run() reports the cancellation
+            self.current.cancelled = True
+            self.mutex.unlock()
+            return True
+
+        queued = [entry for entry in self.queue if entry[1] != request_id]
+        found = len(queued) != len(self.queue)
+        if found:
+            heapq.heapify(queued)
+            self.queue = queued
+        waiting = len(self.queue)
+        self.mutex.unlock()
+
+        if found:
+            self.queueChanged.emit(waiting)
+            self.requestCancelled.emit(request_id)
+        return found
+
+    def cancelCurrent(self):
+        self.mutex.lock()
+        running = self.current is not None
+        if running:
+            self.current.cancelled = True
+        self.mutex.unlock()
+        return running
+
+    def stop(self):
+        self.mutex.lock()
+        self.stopping = True
+        if self.current is not None:
+            self.current.cancelled = True
+        self.condition.wakeAll()
+        self.mutex.unlock()
+        self.wait()
+
+    def run(self):
+        while True:
+            self.mutex.lock()
+            while not self.queue and not self.stopping:
+                self.condition.wait(self.mutex)
+            if self.stopping:
+                self.mutex.unlock()
+                return
+            _, _, request = heapq.heappop(self.queue)
+            self.current = request
+            llm = self.llm
+            waiting = len(self.queue)
+            self.mutex.unlock()
+
+            self.queueChanged.emit(waiting)
+            self.requestStarted.emit(request.request_id)
+            response = self.generate(llm, request)
+
+            self.mutex.lock()
+            self.current = None
+            self.mutex.unlock()
+
+            if request.cancelled:
+                self.requestCancelled.emit(request.request_id)
+            else:
+                self.result.emit(request.request_id, response)
+
+    def switchSession(self, llm, session):
+        # llama.cpp reuses the longest matching token prefix of whatever is
+        # in the KV cache, so a follow-up turn only evaluates the new tokens
+        # as long as nothing else ran in between
+        if session is self.owner:
+            return
+        if self.owner is not None:
+            self.owner.state = llm.save_state()
+        if session is not None and session.state is not None:
+            llm.load_state(session.state)
+            session.state = None
+        self.owner = session
+
+    def generate(self, llm, request):
+        response = []
+        stream = None
+        session = request.session
+        try:
+            self.switchSession(llm, session)
+            if session is None:
+                messages = [{"role": "user", "content": request.prompt}]
+            else:
+                messages = session.messages(llm, request.prompt, request.max_tokens)
+            stream = llm.create_chat_completion(
+                messages=messages,
+                max_tokens=request.max_tokens,
+                stream=True,
+                **SAMPLING_PARAMS,
+            )
+            for part in stream:
+                if request.cancelled:
+                    break
+                content = part["choices"][0]["delta"].get("content")
+                if content:
+                    response.append(content)
+                    self.chunk.emit(request.request_id, content)
+        except Exception as e:
+            return f"Error: {str(e)}"
+        finally:
+            # Closing the generator stops llama.cpp from decoding further
+            if stream is not None:
+                stream.close()
+        if session is not None and not request.cancelled:
+            session.append(llm, request.prompt, "".join(response))
+        return "".join(response)
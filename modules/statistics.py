@@ -0,0 +1,136 @@
+from collections import namedtuple
+
+from PySide6.QtCore import *
+from PySide6.QtGui import *
+
+# chars, words, word_chars, lines, uppercase, lowercase
+EMPTY_BLOCK = (0, 0, 0, 1, 0, 0)
+
+# QTextBlock.text() keeps soft line breaks (Shift+Enter) as U+2028
+LINE_SEPARATOR = "\u2028"
+
+
+def blockStatistics(text):
+    words = text.split()
+    return (
+        len(text),
+        len(words),
+        sum(map(len, words)),
+        text.count(LINE_SEPARATOR) + 1,
+        sum(map(str.isupper, text)),
+        sum(map(str.islower, text)),
+    )
+
+
+class StatisticsResult(
+    namedtuple(
+        "StatisticsResult",
+        [
+            "character_count",
+            "word_count",
+            "word_character_count",
+            "line_count",
+            "uppercase_count",
+            "lowercase_count",
+            "language",
+        ],
+    )
+):
+    __slots__ = ()
+
+    def averageWordLength(self):
+        if self.word_count == 0:
+            return None
+        return self.word_character_count / self.word_count
+
+    def averageLineLength(self):
+        if self.line_count == 0:
+            return None
+        return (self.character_count / self.line_count) - 1
+
+
+class StatisticsModel:
+    def __init__(self):
+        self.texts = []
+        self.blocks = []
+        self.totals = [0] * len(EMPTY_BLOCK)
+
+    def apply(self, first, old_end, texts):
+        fresh = [blockStatistics(text) for text in texts]
+
+        for stats in self.blocks[first:old_end]:
+            for i, value in enumerate(stats):
+                self.totals[i] -= value
+        for stats in fresh:
+            for i, value in enumerate(stats):
+                self.totals[i] += value
+
+        changed = sum(map(len, self.texts[first:old_end])) + sum(map(len, texts))
+        self.blocks[first:old_end] = fresh
+        self.texts[first:old_end] = texts
+        return changed
+
+    def result(self, language=None):
+        characters, words, word_chars, lines, upper, lower = self.totals
+        # toPlainText() joins blocks with a newline
+        characters += max(len(self.blocks) - 1, 0)
+        return StatisticsResult(
+            characters, words, word_chars, lines, upper, lower, language
+        )
+
+
+class StatisticsEngine(QObject):
+    changed = Signal()
+
+    def __init__(self, document=None, parent=None):
+        super(StatisticsEngine, self).__init__(parent)
+        self.document = None
+        self.block_count = 0
+        self.patches = []
+        self.mutex = QMutex()
+        if document is not None:
+            self.setDocument(document)
+
+    def setDocument(self, document):
+        if self.document is not None:
+            self.document.contentsChange.disconnect(self.contentsChange)
+        self.document = document
+        self.document.contentsChange.connect(self.contentsChange)
+        self.rebuild()
+
+    def rebuild(self):
+        self.mutex.lock()
+        self.patches = []
+        self.mutex.unlock()
+        self.patch(0, None, self.document.blockCount() - 1)
+
+    def contentsChange(self, position, removed, added):
+        delta = self.document.blockCount() - self.block_count
+        last_position = min(position + added, self.document.characterCount() - 1)
+
+        first = self.document.findBlock(position).blockNumber()
+        last = self.document.findBlock(last_position).blockNumber()
+        if first < 0 or last < first or last - delta >= self.block_count:
+            self.rebuild()
+        else:
+            self.patch(first, last - delta + 1, last)
+        self.changed.emit()
+
+    def patch(self, first, old_end, last):
+        block = self.document.findBlockByNumber(first)
+        texts = []
+        for _ in range(first, last + 1):
+            texts.append(block.text())
+            block = block.next()
+
+        self.block_count = self.document.blockCount()
+        self.mutex.lock()
+        self.patches.append((first, old_end, texts))
+        self.mutex.unlock()
+
+    def takePatches(self):
+        self.mutex.lock()
+        patches = self.patches
+        self.patches = []
+        self.mutex.unlock()
+        return patches
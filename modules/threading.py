@@ -1,24 +1,108 @@
-import time
-
 from PySide6.QtCore import *
 
+from modules.language import LanguageDetector
+from modules.statistics import StatisticsModel
+
 
 class ThreadingEngine(QThread):
-    update = Signal()
+    update = Signal(int, object)
 
-    def __init__(self, adaptiveResponse, parent=None):
+    def __init__(self, statistics_engine, parent=None):
         super(ThreadingEngine, self).__init__(parent)
-        self.adaptiveResponse = float(adaptiveResponse)
-        self.running = False
+        self.statistics_engine = statistics_engine
+        self.model = StatisticsModel()
+        self.language_detector = LanguageDetector()
+        self.revision = 0
         self.mutex = QMutex()
 
+    def setRevision(self, revision):
+        self.mutex.lock()
+        self.revision = revision
+        self.mutex.unlock()
+
+    def isStale(self, revision):
+        self.mutex.lock()
+        stale = self.revision != revision
+        self.mutex.unlock()
+        return stale
+
     def run(self):
-        if not self.running:
-            self.mutex.lock()
-            self.running = True
-            self.mutex.unlock()
-            time.sleep(0.15 * self.adaptiveResponse)
-            self.update.emit()
-            self.mutex.lock()
-            self.running = False
-            self.mutex.unlock()
+        self.mutex.lock()
+        revision = self.revision
+        self.mutex.unlock()
+
+        # Patches are deltas, so they are always applied even for a stale run
+        for first, old_end, texts in self.statistics_engine.takePatches():
+            if self.isInterruptionRequested():
+                return
+            changed = self.model.apply(first, old_end, texts)
+            self.language_detector.invalidate(changed)
+        if self.isStale(revision):
+            return
+
+        result = self.model.result()
+        if result.word_count > 20:
+            language = self.language_detector.detectDocument(
+                self.model.texts, result.character_count
+            )
+            if self.isStale(revision):
+                return
+            result = result._replace(language=language)
+        self.update.emit(revision, result)
+
+
+class StatisticsScheduler(QObject):
+    ready = Signal(object)
+
+    def __init__(self, adaptiveResponse, statistics_engine, parent=None):
+        super(StatisticsScheduler, self).__init__(parent)
+        self.revision = 0
+        self.completed = -1
+        self.computations = 0
+        self.stopped = False
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.dispatch)
+        self.setAdaptiveResponse(adaptiveResponse)
+
+        self.engine = ThreadingEngine(statistics_engine, self)
+        self.engine.update.connect(self.collect)
+        self.engine.finished.connect(self.engineFinished)
+
+        statistics_engine.changed.connect(self.schedule)
+        QCoreApplication.instance().aboutToQuit.connect(self.stop)
+        self.schedule()
+
+    def setAdaptiveResponse(self, adaptiveResponse):
+        self.timer.setInterval(int(150 * float(adaptiveResponse)))
+
+    def schedule(self):
+        self.revision += 1
+        self.engine.setRevision(self.revision)
+        self.timer.start()
+
+    def dispatch(self):
+        if self.stopped or self.engine.isRunning():
+            return
+        self.computations += 1
+        self.engine.start()
+
+    def collect(self, revision, result):
+        if revision == self.revision:
+            self.completed = revision
+            self.ready.emit(result)
+
+    def engineFinished(self):
+        if self.completed != self.revision and not self.timer.isActive():
+            self.dispatch()
+
+    def stop(self):
+        # A pass over a large document takes seconds; the thread must be gone
+        # before the engine is destroyed
+        self.stopped = True
+        self.timer.stop()
+        self.revision += 1
+        self.engine.setRevision(self.revision)
+        self.engine.requestInterruption()
+        self.engine.wait()
@@ -0,0 +1,21 @@
+import time
+
+
+class StageTimer:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.last = self.started
+        self.stages = []
+
+    def mark(self, name):
+        now = time.perf_counter()
+        self.stages.append((name, now - self.last))
+        self.last = now
+
+    def total(self):
+        return self.last - self.started
+
+    def summary(self):
+        return ", ".join(
+            f"{name} {elapsed * 1000:.0f} ms" for name, elapsed in self.stages
+        )
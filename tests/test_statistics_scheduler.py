@@ -0,0 +1,57 @@
+import os
+import sys
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PySide6.QtCore import *
+from PySide6.QtGui import *
+
+from modules.statistics import StatisticsEngine
+from modules.threading import StatisticsScheduler
+
+app = QGuiApplication.instance() or QGuiApplication([])
+
+
+def waitFor(condition, timeout=10):
+    deadline = time.perf_counter() + timeout
+    while not condition() and time.perf_counter() < deadline:
+        app.processEvents()
+        time.sleep(0.01)
+    return condition()
+
+
+def test_rapid_edits_coalesce():
+    document = QTextDocument()
+    # contentsChange is only emitted once the document has a layout
+    document.documentLayout()
+    engine = StatisticsEngine(document)
+    scheduler = StatisticsScheduler(1, engine)
+    results = []
+    scheduler.ready.connect(results.append)
+
+    cursor = QTextCursor(document)
+    for _ in range(50):
+        cursor.insertText("word ")
+
+    assert waitFor(lambda: scheduler.completed == scheduler.revision)
+    assert 1 <= scheduler.computations <= 2
+    assert results[-1].word_count == 50
+    scheduler.stop()
+
+
+def test_stop_waits_for_engine():
+    document = QTextDocument()
+    document.documentLayout()
+    document.setPlainText("word " * 200000)
+    engine = StatisticsEngine(document)
+    scheduler = StatisticsScheduler(0, engine)
+
+    assert waitFor(scheduler.engine.isRunning)
+    scheduler.stop()
+    assert not scheduler.engine.isRunning()
+
+    scheduler.schedule()
+    app.processEvents()
+    assert not scheduler.engine.isRunning()